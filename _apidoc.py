@@ -15,6 +15,10 @@ I am apiDoc history file.
 @apiDefine admin_Admin Admin API - 管理员
 """
 
+"""
+@apiDefine admin_Batch Admin API - 批量请求
+"""
+
 """
 @apiDefine admin_Ext Admin Extensions
 """
@@ -27,6 +31,13 @@ I am apiDoc history file.
 @apiParam [per_page] 每页几条
 """
 
+"""
+@apiDefine paginate_by_cursor
+@apiParam [cursor] 游标（上一次响应中的next_cursor或prev_cursor）
+@apiParam [per_page] 每页几条（最多100条）
+@apiParam [total] 为1时返回总条数
+"""
+
 # apiSuccess
 
 """
@@ -91,3 +102,8 @@ I am apiDoc history file.
 @apiDefine e1303
 @apiError (错误码) 1303 密码长度不符合要求
 """
+
+"""
+@apiDefine e1304
+@apiError (错误码) 1304 登录尝试过于频繁
+"""
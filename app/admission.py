@@ -0,0 +1,88 @@
+from os import getenv
+from threading import Semaphore
+from time import perf_counter
+from typing import Iterable, Optional
+
+from flask import Flask, Response, g, request
+
+from .api_utils import APIError
+from .metrics import Sample, metrics
+
+
+class AdmissionControl:
+    """准入控制（每个worker）：限制同时处理的请求数，超出时在有界队列中等待，队列满或等待超时则立即返回503
+
+    eventlet下Semaphore为绿色版本，等待只挂起当前greenlet。
+    """
+
+    def __init__(self, max_in_flight: int=100, max_queue: int=100, queue_timeout: float=2):
+        """Initializer
+
+        Args:
+            max_in_flight: 同时处理的最大请求数，为0时不限制
+            max_queue: 等待队列的最大长度
+            queue_timeout: 在队列中的最长等待时间（秒）
+        """
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.exempt = {'bp_health', 'bp_admin_ext.get_metrics'}  # 不受限制的endpoint或blueprint
+        self.in_flight = 0
+        self.waiting = 0
+        self._slots = Semaphore(max_in_flight)
+
+    def init_app(self, app: Flask) -> None:
+        """注册请求钩子（应在其他钩子之前注册，被拒绝的请求不执行后续的钩子）"""
+        if self.max_in_flight > 0:
+            app.before_request(self._before_request)
+            app.teardown_request(self._teardown_request)
+
+    def _before_request(self) -> Optional[Response]:
+        if request.endpoint in self.exempt or request.blueprint in self.exempt:
+            return None
+        if not self._slots.acquire(blocking=False):
+            if self.waiting >= self.max_queue:
+                return self._reject('queue_full')
+            self.waiting += 1
+            start = perf_counter()
+            try:
+                acquired = self._slots.acquire(timeout=self.queue_timeout)
+            finally:
+                self.waiting -= 1
+            metrics.observe('admission_wait_seconds', perf_counter() - start)
+            if not acquired:
+                return self._reject('timeout')
+        self.in_flight += 1
+        g.admitted = True  # g.admitted
+        return None
+
+    def _teardown_request(self, e: Exception=None) -> None:
+        if g.pop('admitted', False):
+            self.in_flight -= 1
+            self._slots.release()
+
+    @staticmethod
+    def _reject(reason: str) -> Response:
+        """返回503（后续的钩子包括metrics的都不执行，这里单独计入请求数）"""
+        metrics.inc('admission_rejected_total', reason=reason)
+        metrics.inc('http_requests_total', endpoint=request.endpoint or 'none', status=503)
+        metrics.flush()
+        response = APIError(1001, status_code=503).to_response()
+        response.headers['Retry-After'] = '1'
+        return response
+
+
+admission = AdmissionControl(
+    max_in_flight=int(getenv('ADMISSION_MAX_IN_FLIGHT') or 100),
+    max_queue=int(getenv('ADMISSION_MAX_QUEUE') or 100),
+    queue_timeout=float(getenv('ADMISSION_QUEUE_TIMEOUT') or 2)
+)
+metrics.describe('admission_wait_seconds', 'histogram', '准入控制的排队时间')
+metrics.describe('admission_rejected_total', 'counter', '准入控制拒绝的请求数')
+metrics.describe('admission', 'gauge', '准入控制状态')
+
+
+@metrics.collector
+def _collect_admission() -> Iterable[Sample]:
+    yield 'admission', {'stat': 'in_flight'}, admission.in_flight
+    yield 'admission', {'stat': 'waiting'}, admission.waiting
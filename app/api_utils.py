@@ -1,8 +1,31 @@
+import gzip
+import re
+from datetime import date, datetime
+from decimal import Decimal
+from functools import wraps
+from logging import INFO
+from hashlib import md5, sha1
 from numbers import Number
+from os import getenv
+from typing import Any, Callable, Iterable, List, Tuple
+from uuid import UUID
 
-from flask import abort, current_app, g, make_response, request, Response
-from peewee import Query
+from flask import abort, current_app, g, request, stream_with_context, url_for, Response
+from itsdangerous import BadSignature, URLSafeSerializer
+from peewee import Field, ModelSelect, Query
 from werkzeug.exceptions import HTTPException
+from werkzeug.urls import url_encode
+
+try:
+    import brotli
+except ImportError:  # 可选依赖
+    brotli = None
+
+from utils.log_util import format_body, sample_body
+from utils.redis_util import redis_client
+from utils.string_util import to_bytes
+from .database import db
+from .misc import json_backend
 
 
 __all__ = [
@@ -14,7 +37,10 @@ __all__ = [
     'handle_403_error',
     'handle_404_error',
     'before_api_request',
+    'after_api_request',
+    'etag_by_version',
     'api_success_response',
+    'api_stream_response',
     'claim_args',
     'claim_args_true',
     'claim_args_bool',
@@ -24,9 +50,16 @@ __all__ = [
     'claim_args_digit_str',
     'claim_args_list',
     'claim_args_dict',
-    'paginate'
+    'compile_schema',
+    'validate_json',
+    'paginate',
+    'paginate_by_cursor'
 ]
 
+MAX_PER_PAGE = 100  # 每页最大条数
+COMPRESS_MIN_SIZE = int(getenv('COMPRESS_MIN_SIZE') or 1024)  # 响应压缩的最小长度（字节）
+COMPRESS_ENCODINGS = ['br', 'gzip'] if brotli is not None else ['gzip']  # 优先顺序
+
 
 class APIError(Exception):
     """API错误"""
@@ -34,6 +67,7 @@ class APIError(Exception):
     # 错误码 & 错误描述
     ERRORS = {
         1000: 'Internal Server Error',
+        1001: 'Service Unavailable',
         1100: 'Bad Request',
         1101: 'Unauthorized',
         1103: 'Forbidden',
@@ -45,7 +79,8 @@ class APIError(Exception):
         1205: 'json数据值错误',
         1301: '用户名错误',
         1302: '密码错误',
-        1303: '密码长度不符合要求'
+        1303: '密码长度不符合要求',
+        1304: '登录尝试过于频繁'
     }
 
     def __init__(self, code: int, message: str=None, status_code: int=200):
@@ -61,14 +96,17 @@ class APIError(Exception):
         self.message = message or self.ERRORS.get(code, 'Undefined')
         self.status_code = status_code
 
-    def to_response(self) -> Response:
-        """转换为flask.Response"""
-        resp_data = {
+    def to_dict(self) -> dict:
+        """转换为响应数据"""
+        return {
             'code': self.code,
             'message': self.message,
             'data': {}
         }
-        return make_response(resp_data, self.status_code)
+
+    def to_response(self) -> Response:
+        """转换为flask.Response"""
+        return json_backend.response(self.to_dict(), self.status_code)
 
 
 def handle_api_error(e: APIError) -> Response:
@@ -116,21 +154,126 @@ def before_api_request() -> None:
         if request.is_json:
             g.json = request.get_json()  # g.json
             if isinstance(g.json, dict):
-                if request.view_args:
-                    current_app.logger.info('JSON -> {0.endpoint} {0.view_args}: {1}'.format(request, g.json))
-                else:
-                    current_app.logger.info('JSON -> {0}: {1}'.format(request.endpoint, g.json))
+                if sample_body() and current_app.logger.isEnabledFor(INFO):
+                    body = format_body(g.json)  # 隐去敏感字段 & 截断
+                    if request.view_args:
+                        current_app.logger.info('JSON -> {0.endpoint} {0.view_args}: {1}'.format(request, body))
+                    else:
+                        current_app.logger.info('JSON -> {0}: {1}'.format(request.endpoint, body))
                 return
         abort(400)
 
 
-def api_success_response(data: dict) -> dict:
+def after_api_request(response: Response) -> Response:
+    """API请求后钩子函数：GET请求的条件响应（强ETag、304）& 响应压缩（br/gzip）
+
+    没有ETag的响应由响应体的SHA1生成ETag；压缩后的ETag带上编码后缀（如"<sha1>-gzip"），
+    不同编码的表示互不混淆。流式响应不处理。
+    """
+    if request.method not in ['GET', 'HEAD'] or response.status_code != 200 or response.is_streamed \
+            or 'Content-Encoding' in response.headers:
+        return response
+    body = response.get_data()
+    encoding = None
+    if len(body) >= COMPRESS_MIN_SIZE:
+        response.vary.add('Accept-Encoding')
+        encoding = request.accept_encodings.best_match(COMPRESS_ENCODINGS)
+    etag, weak = response.get_etag()
+    if etag is None:
+        etag, weak = sha1(body).hexdigest(), False
+    if encoding:
+        etag = '{0}-{1}'.format(etag, encoding)
+    response.set_etag(etag, weak)
+    if request.if_none_match.contains_weak(etag):
+        response.status_code = 304  # 304响应不发送响应体和实体头部
+        return response
+    if encoding == 'br':
+        response.set_data(brotli.compress(body, quality=5))
+    elif encoding == 'gzip':
+        response.set_data(gzip.compress(body, compresslevel=6))
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def api_success_response(data: dict) -> Response:
     """API请求成功的响应"""
-    return {
+    resp_data = {
         'code': 0,
         'message': 'Success',
         'data': data
     }
+    return json_backend.response(resp_data)
+
+
+def api_stream_response(rows: Iterable, *, key: str='items', serializer: Callable[[Any], Any]=None,
+                        extra: dict=None, chunk_size: int=200) -> Response:
+    """API请求成功的流式响应：{"code": 0, "message": "Success", "data": {<extra>, <key>: [<rows>]}}
+
+    rows为peewee查询时通过db.iter_unbuffered以无缓冲游标逐行读取（单独的连接，不缓存结果集和模型对象），
+    每chunk_size行编码一次并输出。
+
+    Args:
+        rows: 查询或可迭代对象
+        key: 列表在data中的键
+        serializer: 行的转换函数，默认调用行的to_dict()
+        extra: data中的其他数据
+        chunk_size: 每次编码的行数
+    """
+    if isinstance(rows, Query):
+        rows = db.iter_unbuffered(rows)
+    if serializer is None:
+        serializer = _default_row_serializer
+
+    dumps = json_backend.dumps
+
+    def generate():
+        head = dumps({'code': 0, 'message': 'Success'})[:-1]
+        extra_items = dumps(extra)[1:-1] + b',' if extra else b''
+        yield b''.join([head, b',"data":{', extra_items, dumps(key), b':['])
+        chunk, first = [], True
+        try:
+            for row in rows:
+                chunk.append(serializer(row))
+                if len(chunk) >= chunk_size:
+                    yield (b'' if first else b',') + dumps(chunk)[1:-1]
+                    chunk, first = [], False
+            if chunk:
+                yield (b'' if first else b',') + dumps(chunk)[1:-1]
+        except Exception as e:
+            current_app.logger.exception(e)  # 响应已经开始，只能中断输出
+            return
+        yield b']}}'
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+
+def _default_row_serializer(row):
+    return row.to_dict() if hasattr(row, 'to_dict') else row
+
+
+def etag_by_version(get_version: Callable[[], Any]) -> Callable:
+    """视图装饰器：由资源的版本（如模型的id、update_time）生成ETag，不必序列化响应体
+
+    客户端缓存的ETag（任一编码后缀）与当前版本一致时直接返回304，不执行视图。
+
+    Args:
+        get_version: 返回当前版本的函数，返回值的repr()用于计算ETag
+    """
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            etag = sha1(to_bytes('{0}:{1!r}'.format(request.endpoint, get_version()))).hexdigest()
+            for tag in [etag] + ['{0}-{1}'.format(etag, encoding) for encoding in COMPRESS_ENCODINGS]:
+                if request.if_none_match.contains_weak(tag):
+                    response = current_app.response_class(status=304)
+                    response.set_etag(tag)
+                    return response
+            response = current_app.make_response(func(*args, **kwargs))
+            response.set_etag(etag)
+            return response
+        return wrapper
+    return decorator
 
 
 def claim_args(code: int, *args, message: str=None) -> None:
@@ -250,6 +393,132 @@ def claim_args_dict(code: int, *args, message: str=None) -> None:
             raise APIError(code, message)
 
 
+def compile_schema(schema: dict) -> Callable[[dict], None]:
+    """把声明式的请求数据schema编译为校验函数（只在导入时编译一次）
+
+    schema被转换为一个Python函数的源码并编译，校验时没有规则解释和逐条调用的开销。
+    校验按阶段进行，错误码与claim_args_*的用法一致：先检查所有必填字段（1203），再检查所有类型（1204），
+    最后检查取值（1205，可由规则的code代替）。
+
+    Args:
+        schema: {字段名: 规则}，规则的键：
+            - required: 是否必填，默认为True；缺少或为空值（Number除外）时错误码1203，非必填字段为None时跳过
+            - type: 类型或类型元组，不符合时错误码1204
+            - min_len/max_len: 长度范围
+            - min/max: 取值范围
+            - regex: 正则表达式（完整匹配）
+            - choices: 可选值
+            - schema: 嵌套对象（dict）的schema
+            - items: 列表（list）元素的规则（不含required）
+            - code: 取值不符合时的错误码，默认为1205
+
+    Returns:
+        校验函数，数据不符合时抛出APIError
+    """
+    consts = {}
+    rules = list(schema.items())
+    lines = ['def validate(data):', '    get = data.get']
+    lines.extend('    v{0} = get({1!r})'.format(i, name) for i, (name, _) in enumerate(rules))
+    for i, (_, rule) in enumerate(rules):
+        if rule.get('required', True):
+            lines.append('    if not (v{0} or isinstance(v{0}, Number)): raise APIError(1203)'.format(i))
+    for i, (_, rule) in enumerate(rules):
+        if 'type' in rule:
+            cond = 'not isinstance(v{0}, {1})'.format(i, _schema_const(consts, rule['type']))
+            if not rule.get('required', True):
+                cond = 'v{0} is not None and {1}'.format(i, cond)
+            lines.append('    if {0}: raise APIError(1204)'.format(cond))
+    for i, (_, rule) in enumerate(rules):
+        cond = _value_condition('v{0}'.format(i), rule, consts)
+        if cond:
+            indent = '    '
+            if not rule.get('required', True):
+                lines.append('    if v{0} is not None:'.format(i))
+                indent += '    '
+            lines.extend(_value_check_lines(cond, rule.get('code', 1205), indent))
+    lines.append('    return None')
+    return _exec_schema_source(lines, consts, 'validate')
+
+
+def _schema_const(consts: dict, value: Any) -> str:
+    """登记编译后的函数中使用的常量，返回其变量名"""
+    name = '_c{0}'.format(len(consts))
+    consts[name] = value
+    return name
+
+
+def _value_condition(var: str, rule: dict, consts: dict) -> str:
+    """规则中取值约束的条件表达式（全部满足时为真），没有取值约束时返回空字符串"""
+    conds = []
+    if 'min_len' in rule:
+        conds.append('len({0}) >= {1}'.format(var, _schema_const(consts, rule['min_len'])))
+    if 'max_len' in rule:
+        conds.append('len({0}) <= {1}'.format(var, _schema_const(consts, rule['max_len'])))
+    if 'min' in rule:
+        conds.append('{0} >= {1}'.format(var, _schema_const(consts, rule['min'])))
+    if 'max' in rule:
+        conds.append('{0} <= {1}'.format(var, _schema_const(consts, rule['max'])))
+    if 'regex' in rule:
+        pattern = _schema_const(consts, re.compile(rule['regex']))
+        conds.append('isinstance({0}, str) and {1}.fullmatch({0}) is not None'.format(var, pattern))
+    if 'choices' in rule:
+        conds.append('{0} in {1}'.format(var, _schema_const(consts, frozenset(rule['choices']))))
+    if 'schema' in rule:
+        validate = _schema_const(consts, compile_schema(rule['schema']))
+        conds.append('isinstance({0}, dict) and {1}({0}) is None'.format(var, validate))
+    if 'items' in rule:
+        conds.append('{0}({1})'.format(_schema_const(consts, _compile_items(rule['items'])), var))
+    return ' and '.join(conds)
+
+
+def _value_check_lines(cond: str, code: int, indent: str) -> List[str]:
+    """取值检查的源码，值的类型不支持约束时（如未声明type）同样视为取值错误"""
+    return [
+        indent + 'try:',
+        indent + '    if not ({0}): raise APIError({1})'.format(cond, code),
+        indent + 'except TypeError:',
+        indent + '    raise APIError({0}) from None'.format(code)
+    ]
+
+
+def _compile_items(rule: dict) -> Callable[[Any], bool]:
+    """把列表元素的规则编译为检查函数：元素类型错误时错误码1204，取值错误时为规则的code（默认1205）"""
+    consts = {}
+    lines = [
+        'def check_items(value):',
+        '    for item in value:',
+        '        if not isinstance(item, {0}): raise APIError(1204)'.format(_schema_const(consts, rule.get('type', object)))
+    ]
+    cond = _value_condition('item', rule, consts)
+    if cond:
+        lines.extend(_value_check_lines(cond, rule.get('code', 1205), '        '))
+    lines.append('    return True')
+    return _exec_schema_source(lines, consts, 'check_items')
+
+
+def _exec_schema_source(lines: List[str], consts: dict, func_name: str) -> Callable:
+    namespace = dict(consts, APIError=APIError, Number=Number)
+    exec(compile('\n'.join(lines), '<schema>', 'exec'), namespace)
+    return namespace[func_name]
+
+
+def validate_json(schema: dict) -> Callable:
+    """视图装饰器：按schema校验g.json
+
+    Args:
+        schema: 参考compile_schema
+    """
+    validate = compile_schema(schema)
+
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            validate(g.json)
+            return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
 def paginate(query: Query) -> Query:
     """分页查询"""
     page, per_page = map(request.args.get, ['page', 'per_page'])
@@ -261,7 +530,106 @@ def paginate(query: Query) -> Query:
     else:
         if page > 0:
             if per_page > 0:
-                return query.paginate(page, per_page)
+                return query.paginate(page, min(per_page, MAX_PER_PAGE))
             else:
                 return query.paginate(page)
     return query
+
+
+def _cursor_serializer() -> URLSafeSerializer:
+    return URLSafeSerializer(current_app.secret_key, salt='paginate_by_cursor')
+
+
+def _cursor_value(value):
+    """将排序字段的值转换为可以JSON序列化的值"""
+    if isinstance(value, datetime):
+        return str(value)  # 与peewee DateTimeField的格式一致
+    if isinstance(value, (date, Decimal, UUID)):
+        return str(value)
+    return value
+
+
+def paginate_by_cursor(query: ModelSelect, sort_field: Field, *, desc: bool=True, per_page: int=20) -> Tuple[List, dict]:
+    """游标分页查询（keyset），按(sort_field, id)排序，任意页的代价与第一页相同
+
+    url参数：cursor - 上一次返回的游标；per_page - 每页几条（不超过MAX_PER_PAGE）；
+    total - 为1时返回总条数（缓存60秒）
+
+    Args:
+        query: 模型查询（不要带order_by）
+        sort_field: 排序字段（不能为null，NULL无法参与(sort_field, id)的比较）
+        desc: 是否降序
+        per_page: 默认每页条数
+
+    Returns:
+        (本页的对象列表, 分页信息{'per_page', 'next', 'prev', 'next_cursor', 'prev_cursor', 'total'})
+
+    Raises:
+        ValueError: sort_field可以为null
+        APIError
+    """
+    if sort_field.null:
+        raise ValueError('sort_field {0} is nullable'.format(sort_field.name))
+    model = query.model
+    pk = model._meta.primary_key
+    cursor, _per_page, with_total = map(request.args.get, ['cursor', 'per_page', 'total'])
+    try:
+        per_page = int(_per_page) if _per_page else per_page
+    except ValueError:
+        raise APIError(1202)
+    per_page = max(1, min(per_page, MAX_PER_PAGE))
+
+    backward = False
+    page_query = query
+    if cursor:
+        try:
+            value, pk_value, direction = _cursor_serializer().loads(cursor)
+        except (BadSignature, TypeError, ValueError):
+            raise APIError(1202)
+        backward = direction == 'prev'
+        if desc != backward:
+            cond = pk < pk_value if sort_field is pk else (sort_field < value) | ((sort_field == value) & (pk < pk_value))
+        else:
+            cond = pk > pk_value if sort_field is pk else (sort_field > value) | ((sort_field == value) & (pk > pk_value))
+        page_query = page_query.where(cond)
+    reverse = desc != backward
+    ordering = [sort_field.desc() if reverse else sort_field.asc()]
+    if sort_field is not pk:
+        ordering.append(pk.desc() if reverse else pk.asc())
+    items = list(page_query.order_by(*ordering).limit(per_page + 1))
+    has_more = len(items) > per_page
+    items = items[:per_page]
+    if backward:
+        items.reverse()
+
+    def make_cursor(obj, direction: str) -> str:
+        return _cursor_serializer().dumps([_cursor_value(getattr(obj, sort_field.name)), obj._pk, direction])
+
+    def make_url(token: str) -> str:
+        args = request.args.to_dict()
+        args['cursor'] = token
+        return url_for(request.endpoint, **(request.view_args or {})) + '?' + url_encode(args)  # 查询参数可能与路径参数同名
+
+    next_cursor = prev_cursor = None
+    if items:
+        if has_more or backward:
+            next_cursor = make_cursor(items[-1], 'next')
+        if cursor and (has_more or not backward):
+            prev_cursor = make_cursor(items[0], 'prev')
+    pagination = {
+        'per_page': per_page,
+        'next_cursor': next_cursor,
+        'prev_cursor': prev_cursor,
+        'next': make_url(next_cursor) if next_cursor else None,
+        'prev': make_url(prev_cursor) if prev_cursor else None,
+        'total': None
+    }
+    if with_total == '1':
+        sql, params = query.sql()
+        key = 'paginate:total:{0}'.format(md5(to_bytes('{0}{1!r}'.format(sql, params))).hexdigest())
+        total = redis_client.get(key)
+        if total is None:
+            total = query.count()
+            redis_client.set(key, total, ex=60)
+        pagination['total'] = int(total)
+    return items, pagination
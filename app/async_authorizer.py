@@ -0,0 +1,139 @@
+import asyncio
+from json import dumps, loads
+from os import getenv
+from typing import Dict, List
+from weakref import WeakKeyDictionary
+
+import aiohttp
+
+from utils.string_util import to_bytes
+
+
+_limiters = WeakKeyDictionary()  # 事件循环 -> {appid: Semaphore}
+
+
+class AsyncAuthorizer:
+    """授权方微信接口的asyncio客户端，与Authorizer的同名方法对应，用于huey任务和脚本中大量并发调用
+
+    同一事件循环中同一appid的并发请求数不超过concurrency（所有客户端共用）。
+    不要在eventlet的greenlet中使用（huey的线程worker或独立脚本中通过asyncio.run执行）：
+
+        async with AsyncAuthorizer(authorizer) as client:
+            infos = await asyncio.gather(*[client.get_user_info(openid) for openid in openids])
+    """
+    BASE_URL = 'https://api.weixin.qq.com'
+
+    def __init__(self, authorizer, concurrency: int=None, base_url: str=BASE_URL):
+        """Initializer
+
+        Args:
+            authorizer: 授权方（Authorizer），使用其appid和get_access_token
+            concurrency: 每个appid的最大并发请求数，默认为WX_ASYNC_CONCURRENCY
+            base_url: 微信接口地址（测试时可指向本地的模拟服务）
+        """
+        self.appid = authorizer.appid
+        self.base_url = base_url.rstrip('/')
+        self.concurrency = concurrency or int(getenv('WX_ASYNC_CONCURRENCY') or 20)
+        self._get_access_token = authorizer.get_access_token
+        self._session = None
+
+    async def __aenter__(self) -> 'AsyncAuthorizer':
+        timeout = aiohttp.ClientTimeout(sock_connect=float(getenv('HTTP_CONNECT_TIMEOUT') or 3.05),
+                                        sock_read=float(getenv('HTTP_READ_TIMEOUT') or 10))
+        connector = aiohttp.TCPConnector(limit_per_host=self.concurrency)
+        self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        """关闭连接"""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def get_user_info(self, openid: str) -> dict:
+        """获取微信用户基本信息
+
+        Raises:
+            aiohttp.ClientError
+            RuntimeError
+        """
+        params = {
+            'openid': openid,
+            'lang': 'zh_CN'
+        }
+        return await self._request('GET', '/cgi-bin/user/info', params=params)
+
+    async def get_tags(self) -> List[dict]:
+        """获取标签列表
+
+        Raises:
+            aiohttp.ClientError
+            RuntimeError
+        """
+        ret = await self._request('GET', '/cgi-bin/tags/get')
+        return ret['tags']
+
+    async def get_tag_users(self, tag_id: int, next_openid: str=None) -> dict:
+        """获取标签下用户列表
+
+        Raises:
+            aiohttp.ClientError
+            RuntimeError
+        """
+        body = {
+            'tagid': tag_id,
+            'next_openid': next_openid
+        }
+        return await self._request('POST', '/cgi-bin/user/tag/get', body=body)
+
+    async def batch_get_user_info(self, openid_list: List[str]) -> List[dict]:
+        """批量获取用户基本信息
+
+        Raises:
+            aiohttp.ClientError
+            RuntimeError
+        """
+        body = {
+            'user_list': [{'openid': openid, 'lang': 'zh_CN'} for openid in openid_list]
+        }
+        ret = await self._request('POST', '/cgi-bin/user/info/batchget', body=body)
+        return ret['user_info_list']
+
+    async def send_custom_msg(self, openid: str, msg_type: str, msg_data: dict) -> None:
+        """发送客服消息
+
+        Raises:
+            aiohttp.ClientError
+            RuntimeError
+        """
+        body = {
+            'touser': openid,
+            'msgtype': msg_type,
+            msg_type: msg_data
+        }
+        await self._request('POST', '/cgi-bin/message/custom/send', body=body)
+
+    async def _request(self, method: str, path: str, params: dict=None, body: dict=None) -> dict:
+        """调用接口，errcode不为0时抛出RuntimeError"""
+        if self._session is None:
+            raise RuntimeError('AsyncAuthorizer must be used with "async with"')
+        loop = asyncio.get_running_loop()
+        access_token = await loop.run_in_executor(None, self._get_access_token)  # 读取Redis时不阻塞事件循环
+        params = {'access_token': access_token, **(params or {})}
+        data = None if body is None else to_bytes(dumps(body, ensure_ascii=False))
+        async with self._limiter(loop):
+            async with self._session.request(method, self.base_url + path, params=params, data=data,
+                                             raise_for_status=True) as resp:
+                ret = loads(await resp.read())  # 按utf-8解析（同utils.http_util.parse_json）
+        if ret.get('errcode'):
+            raise RuntimeError(repr(ret))
+        return ret
+
+    def _limiter(self, loop: asyncio.AbstractEventLoop) -> asyncio.Semaphore:
+        semaphores: Dict[str, asyncio.Semaphore] = _limiters.setdefault(loop, {})
+        if self.appid not in semaphores:
+            semaphores[self.appid] = asyncio.Semaphore(self.concurrency)
+        return semaphores[self.appid]
@@ -13,5 +13,6 @@ bp_admin_api.register_error_handler(403, handle_403_error)
 bp_admin_api.register_error_handler(404, handle_404_error)
 bp_admin_api.before_request(before_api_request)
 bp_admin_api.before_request(admin_auth)
+bp_admin_api.after_request(after_api_request)
 
-from . import v_admin
+from . import v_admin, v_batch
@@ -1,11 +1,17 @@
 from flask import g
 
+from utils.rate_limit_util import login_limiter
 from . import bp_admin_api
 from ...api_utils import *
+from ...metrics import metrics
 from ...models import Admin
 
 
 @bp_admin_api.route('/admin/login/', methods=['PUT'])
+@validate_json({
+    'username': {'type': str},
+    'password': {'type': str}
+})
 def login():
     """
     @apiVersion 1.0.0
@@ -24,10 +30,13 @@ def login():
     @apiUse e1204
     @apiUse e1301
     @apiUse e1302
+    @apiUse e1304
     """
     username, password = map(g.json.get, ['username', 'password'])
-    claim_args(1203, username, password)
-    claim_args_str(1204, username, password)
+    limited = login_limiter.hit(ip=g.ip, username=username)  # 在校验密码（CPU密集）之前限流
+    metrics.inc('rate_limit_total', limiter=login_limiter.name, result='limited_' + limited[0] if limited else 'allowed')
+    if limited:
+        raise APIError(1304, '登录尝试过于频繁，请{0}秒后重试'.format(int(limited[1]) + 1))
     admin = Admin.get_by_username(username)
     claim_args_true(1301, admin)
     claim_args_true(1302, admin.check_password(password))
@@ -41,6 +50,7 @@ def login():
 
 
 @bp_admin_api.route('/current_admin/', methods=['GET'])
+@etag_by_version(lambda: (g.admin.id, g.admin.update_time, g.admin.last_login_time))
 def get_current_admin():
     """
     @apiVersion 1.0.0
@@ -59,6 +69,9 @@ def get_current_admin():
 
 
 @bp_admin_api.route('/current_admin/password/', methods=['PUT'])
+@validate_json({
+    'password': {'type': str, 'min_len': Admin.MIN_PW_LEN, 'max_len': Admin.MAX_PW_LEN, 'code': 1303}
+})
 def update_current_admin_password():
     """
     @apiVersion 1.0.0
@@ -74,9 +87,6 @@ def update_current_admin_password():
     @apiUse e1303
     """
     password = g.json.get('password')
-    claim_args(1203, password)
-    claim_args_str(1204, password)
-    claim_args_true(1303, Admin.MIN_PW_LEN <= len(password) <= Admin.MAX_PW_LEN)
 
     g.admin.set_password(password)
     return api_success_response({})
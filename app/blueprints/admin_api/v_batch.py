@@ -0,0 +1,182 @@
+from contextlib import contextmanager
+from os import getenv
+
+from flask import _request_ctx_stack, current_app, g, request
+from werkzeug.exceptions import HTTPException
+from werkzeug.test import EnvironBuilder
+
+from utils.security_util import is_green
+from . import bp_admin_api
+from .hooks import admin_auth
+from ...api_utils import *
+from ...database import db
+
+
+BATCH_MAX_REQUESTS = int(getenv('BATCH_MAX_REQUESTS') or 20)  # 每次批量请求的最大子请求数
+BATCH_MAX_CONCURRENCY = int(getenv('BATCH_MAX_CONCURRENCY') or 5)  # 并发执行的最大greenlet数
+
+_HTTP_ERRORS = {400: 1100, 401: 1101, 403: 1103, 404: 1104, 405: 1104, 308: 1104}  # HTTP状态码 -> 错误码
+_FORWARD_HEADERS = ['Authorization', 'X-Forwarded-For', 'X-Real-Ip', 'X-Request-Id', 'User-Agent']
+_G_COUNTERS = ['db_queries', 'db_time', 'redis_calls', 'http_time']  # 并发子请求累加到批量请求的g中的统计
+
+
+def _sub_environ(sub: dict) -> dict:
+    """子请求的WSGI environ（沿用批量请求的host和部分请求头）"""
+    headers = [(k, request.headers[k]) for k in _FORWARD_HEADERS if k in request.headers]
+    builder = EnvironBuilder(path=sub['path'], base_url=request.url_root, method=sub.get('method') or 'GET',
+                             headers=headers, json=sub.get('json'),
+                             environ_base={'REMOTE_ADDR': request.remote_addr})
+    try:
+        return builder.get_environ()
+    finally:
+        builder.close()
+
+
+def _dispatch() -> dict:
+    """在子请求的上下文中执行：依次执行blueprint的请求钩子、视图函数和响应钩子（与独立请求相同，全局钩子除外），
+    返回{code, message, data}
+
+    子请求不再执行admin_auth，沿用批量请求认证得到的g.admin。
+    """
+    try:
+        adapter = current_app.create_url_adapter(request)
+        request.url_rule, request.view_args = adapter.match(return_rule=True)
+        if request.blueprint != bp_admin_api.name or request.endpoint == batch_endpoint:
+            raise APIError(1104)
+        g.pop('json', None)
+        for func in current_app.before_request_funcs.get(bp_admin_api.name, ()):  # before_api_request
+            if func is admin_auth:
+                continue
+            rv = func()
+            if rv is not None:
+                break
+        else:
+            rv = current_app.view_functions[request.endpoint](**request.view_args)
+        resp = current_app.make_response(rv)
+        for func in reversed(current_app.after_request_funcs.get(bp_admin_api.name, ())):  # after_api_request
+            resp = func(resp)
+        data = resp.get_json(silent=True)
+        if not isinstance(data, dict):
+            raise APIError(1000)
+        return data
+    except APIError as e:
+        return e.to_dict()
+    except HTTPException as e:
+        return APIError(_HTTP_ERRORS.get(e.code, 1000)).to_dict()
+    except Exception as e:
+        current_app.logger.exception(e)
+        return APIError(1000).to_dict()
+
+
+@contextmanager
+def _sub_request(environ: dict):
+    """子请求上下文：替换当前请求上下文中的request（没有时新建，不调用push）
+
+    不执行全局请求钩子（准入控制、metrics等）和teardown，子请求不计入请求数统计。
+    """
+    app = current_app._get_current_object()
+    ctx = _request_ctx_stack.top
+    if ctx is None:
+        ctx = app.request_context(environ)
+        _request_ctx_stack.push(ctx)
+        try:
+            yield
+        finally:
+            _request_ctx_stack.pop()
+        return
+    batch_request, batch_json = ctx.request, g.get('json')
+    ctx.request = app.request_class(environ)
+    try:
+        yield
+    finally:
+        ctx.request, g.json = batch_request, batch_json
+
+
+def _run_sequential(subs: list) -> list:
+    """依次执行：共用批量请求的上下文（g）和数据库连接"""
+    results = []
+    for sub in subs:
+        with _sub_request(_sub_environ(sub)):
+            results.append(_dispatch())
+    return results
+
+
+def _run_concurrent(subs: list) -> list:
+    """并发执行：每个子请求在自己的greenlet和应用上下文中执行（各自从连接池获取数据库连接），
+    SQL数、Redis命令数等累加到批量请求的g
+    """
+    from eventlet import GreenPool
+
+    app = current_app._get_current_object()
+    shared = {k: g.get(k) for k in ['admin', 'ip', 'request_id']}
+    totals = dict.fromkeys(_G_COUNTERS, 0)
+
+    def run(environ: dict) -> dict:
+        with app.app_context():
+            for k, v in shared.items():
+                setattr(g, k, v)
+            try:
+                with _sub_request(environ):
+                    return _dispatch()
+            finally:
+                db.close()  # 归还本greenlet的连接（不计入请求数）
+                for k in _G_COUNTERS:
+                    totals[k] += g.get(k, 0)
+
+    pool = GreenPool(min(BATCH_MAX_CONCURRENCY, len(subs)))
+    results = list(pool.imap(run, [_sub_environ(sub) for sub in subs]))
+    for k, v in totals.items():
+        setattr(g, k, g.get(k, 0) + v)
+    return results
+
+
+@bp_admin_api.route('/batch/', methods=['POST'])
+@validate_json({
+    'requests': {
+        'type': list,
+        'min_len': 1,
+        'max_len': BATCH_MAX_REQUESTS,
+        'items': {
+            'type': dict,
+            'schema': {
+                'path': {'type': str, 'regex': r'/.*'},
+                'method': {'type': str, 'required': False, 'choices': ['GET', 'POST', 'PUT', 'PATCH', 'DELETE']},
+                'json': {'type': dict, 'required': False}
+            }
+        }
+    },
+    'concurrent': {'type': bool, 'required': False}
+})
+def batch():
+    """
+    @apiVersion 1.0.0
+    @api {POST} /api/batch/ 批量请求
+    @apiName admin_batch
+    @apiGroup admin_Batch
+    @apiPermission admin
+    @apiDescription 在一次HTTP请求中执行多个Admin API请求（共用一次身份认证），子请求不能是批量请求
+
+    @apiParam {Object[]} requests 子请求列表（最多20个）
+    @apiParam {String} requests.path 路径（含查询参数），如：/api/current_admin/
+    @apiParam {String} [requests.method] 请求方法，默认为GET
+    @apiParam {Object} [requests.json] json数据（POST、PUT、PATCH）
+    @apiParam {Boolean} [concurrent] 是否并发执行（子请求之间没有依赖时使用），默认依次执行
+
+    @apiSuccess (响应数据) {Object[]} responses 子请求的响应（与requests的顺序一致），包括code、message、data
+
+    @apiUse e1203
+    @apiUse e1204
+    @apiUse e1205
+    """
+    subs = g.json['requests']
+    if g.json.get('concurrent') and len(subs) > 1 and is_green():
+        responses = _run_concurrent(subs)
+    else:
+        responses = _run_sequential(subs)
+    data = {
+        'responses': responses
+    }
+    return api_success_response(data)
+
+
+batch_endpoint = '{0}.{1}'.format(bp_admin_api.name, batch.__name__)
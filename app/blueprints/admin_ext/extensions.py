@@ -2,8 +2,9 @@ from . import bp_admin_ext, appid
 from ...models import db, models, Admin, Authorizer, UserDemo
 from utils.service_util import qn_service
 from urllib.parse import quote_plus
-from flask import current_app, make_response, redirect, request, url_for
+from flask import Response, current_app, make_response, redirect, request, url_for
 from ...component import component
+from ...metrics import metrics
 
 
 @bp_admin_ext.route('/data/init/', methods=['GET'])
@@ -15,6 +16,22 @@ def data_init():
     return 'Success'
 
 
+@bp_admin_ext.route('/stats/', methods=['GET'])
+def get_stats():
+    """运行状态统计（当前worker）"""
+    return {
+        'db': db.pool_stats(),
+        'admin_token_cache': Admin.token_cache_stats()
+    }
+
+
+@bp_admin_ext.route('/metrics/', methods=['GET'])
+def get_metrics():
+    """指标（Prometheus文本格式，所有worker汇总）"""
+    metrics.flush(force=True)
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
 @bp_admin_ext.route('/qn/upload_token/', methods=['GET'])
 def get_qn_upload_token():
     """
@@ -0,0 +1,6 @@
+from flask import Blueprint
+
+
+bp_health = Blueprint('bp_health', __name__)
+
+from . import probes
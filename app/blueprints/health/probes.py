@@ -0,0 +1,83 @@
+from os import getenv
+from time import perf_counter
+from typing import Callable, Tuple
+
+from flask import Response, current_app
+
+from utils.cache_util import TTLCache
+from utils.redis_util import redis_client
+from . import bp_health
+from ...database import db
+from ...misc import json_backend
+from ...tasks import huey
+
+
+HUEY_MAX_PENDING = int(getenv('HEALTH_HUEY_MAX_PENDING') or 10000)  # huey队列积压的上限
+
+_probe_cache = TTLCache(maxsize=1, ttl=float(getenv('HEALTH_CACHE_TTL') or 2))  # 探测结果缓存（每个worker）
+
+
+def _check_mysql() -> dict:
+    for database in filter(None, [db, db.replica]):
+        cursor = database.cursor()  # 直接执行，不经过读写分离
+        cursor.execute('SELECT 1')
+        cursor.fetchone()
+    return {}
+
+
+def _check_redis() -> dict:
+    redis_client.ping()
+    return {}
+
+
+def _check_huey() -> dict:
+    pending = huey.pending_count()
+    if pending > HUEY_MAX_PENDING:
+        raise RuntimeError('pending {0} > {1}'.format(pending, HUEY_MAX_PENDING))
+    return {'pending': pending}
+
+
+CHECKS = [
+    ('mysql', _check_mysql),
+    ('redis', _check_redis),
+    ('huey', _check_huey)
+]
+
+
+def _probe(name: str, check: Callable[[], dict]) -> Tuple[bool, dict]:
+    """执行探测，异常详情（可能包含数据库地址、用户名等）只记录日志，不返回给调用方"""
+    start = perf_counter()
+    try:
+        result, ok = check(), True
+    except Exception as e:
+        current_app.logger.error('Health check {0} failed: {1!r}'.format(name, e))
+        result, ok = {'status': 'unavailable'}, False
+    return ok, dict(result, ok=ok, latency_ms=round((perf_counter() - start) * 1000, 1))
+
+
+def _readiness() -> Tuple[bool, dict]:
+    """依次探测各个依赖，结果缓存HEALTH_CACHE_TTL秒"""
+    cached = _probe_cache.get('readiness')
+    if cached is not None:
+        return cached
+    ready, checks = True, {}
+    for name, check in CHECKS:
+        ok, checks[name] = _probe(name, check)
+        ready = ready and ok
+    db.close()  # 探测用的连接及时归还连接池
+    result = ready, checks
+    _probe_cache.set('readiness', result)
+    return result
+
+
+@bp_health.route('/healthz', methods=['GET'])
+def healthz() -> Response:
+    """存活检查：进程能处理请求"""
+    return json_backend.response({'status': 'ok'})
+
+
+@bp_health.route('/readyz', methods=['GET'])
+def readyz() -> Response:
+    """就绪检查：MySQL、Redis可用且huey队列没有过度积压，否则返回503"""
+    ready, checks = _readiness()
+    return json_backend.response({'status': 'ok' if ready else 'unavailable', 'checks': checks}, 200 if ready else 503)
@@ -6,11 +6,12 @@ from os import getenv
 from time import time
 from typing import Optional, Tuple, Union
 
-import requests
 import xmltodict
 from Crypto.Cipher import AES
 
-from utils.redis_util import redis_client
+from utils.http_util import http_client, parse_json
+from utils.lazy_util import LazyProxy
+from utils.redis_util import credential_cache, get_or_refresh, redis_client
 from utils.string_util import to_bytes, to_str, gen_random_str
 
 
@@ -30,30 +31,42 @@ class WXOPComponent:
 
     @property
     def verify_ticket(self) -> Optional[str]:
-        return to_str(redis_client.get(self._ticket_key()))
+        return to_str(credential_cache.get(self._ticket_key()))
 
     @verify_ticket.setter
     def verify_ticket(self, ticket: str) -> None:
-        redis_client.set(self._ticket_key(), ticket)
-
-    def get_access_token(self) -> str:
-        """获取接口调用凭据"""
-        key = 'component:{0}:access_token'.format(self.app_id)
-        value = redis_client.get(key)
-        if value:
-            return to_str(value)
+        credential_cache.set(self._ticket_key(), ticket)
+
+    def get_access_token(self, force: bool=False) -> str:
+        """获取接口调用凭据（单飞刷新）
+
+        Args:
+            force: 强制刷新
+        """
+        return get_or_refresh(self._access_token_key(), self._fetch_access_token, force=force)  # 提前5分钟更新
+
+    def refresh_access_token(self, min_ttl: int) -> bool:
+        """缓存的接口调用凭据剩余有效期不足min_ttl秒时强制刷新，返回是否刷新"""
+        if redis_client.ttl(self._access_token_key()) >= min_ttl:
+            return False
+        self.get_access_token(force=True)
+        return True
+
+    def _access_token_key(self) -> str:
+        return 'component:{0}:access_token'.format(self.app_id)
+
+    def _fetch_access_token(self) -> Tuple[str, int]:
         url = 'https://api.weixin.qq.com/cgi-bin/component/api_component_token'
         body = {
             'component_appid': self.app_id,
             'component_appsecret': self.app_secret,
             'component_verify_ticket': self.verify_ticket
         }
-        ret = requests.post(url, json=body).json()
+        ret = parse_json(http_client.post(url, json=body))
         access_token, expires_in = map(ret.get, ['component_access_token', 'expires_in'])
         if not (access_token and expires_in):
             raise RuntimeError(repr(ret))
-        redis_client.set(key, access_token, ex=int(expires_in) - 300)  # 提前5分钟更新access_token
-        return access_token
+        return access_token, expires_in
 
     def get_pre_auth_code(self) -> str:
         """获取预授权码"""
@@ -64,7 +77,7 @@ class WXOPComponent:
         body = {
             'component_appid': self.app_id
         }
-        ret = requests.post(url, json=body, params=params).json()
+        ret = parse_json(http_client.post(url, json=body, params=params))
         pre_auth_code = ret.get('pre_auth_code')
         if not pre_auth_code:
             raise RuntimeError(repr(ret))
@@ -80,7 +93,7 @@ class WXOPComponent:
             'component_appid': self.app_id,
             'authorization_code': auth_code
         }
-        ret = requests.post(url, json=body, params=params).json()
+        ret = parse_json(http_client.post(url, json=body, params=params))
         info = ret.get('authorization_info')
         if not info:
             raise RuntimeError(repr(ret))
@@ -96,7 +109,7 @@ class WXOPComponent:
             'component_appid': self.app_id,
             'authorizer_appid': authorizer_appid
         }
-        ret = requests.post(url, json=body, params=params).json()
+        ret = parse_json(http_client.post(url, json=body, params=params))
         base_info, auth_info = map(ret.get, ['authorizer_info', 'authorization_info'])
         if not (base_info and auth_info):
             raise RuntimeError(repr(ret))
@@ -113,7 +126,7 @@ class WXOPComponent:
             'authorizer_appid': authorizer_appid,
             'authorizer_refresh_token': refresh_token
         }
-        ret = requests.post(url, json=body, params=params).json()
+        ret = parse_json(http_client.post(url, json=body, params=params))
         access_token, expires_in = map(ret.get, ['authorizer_access_token', 'expires_in'])
         if not (access_token and expires_in):
             raise RuntimeError(repr(ret))
@@ -164,5 +177,5 @@ class WXOPComponent:
         return xmltodict.unparse(data, full_document=False)
 
 
-component = WXOPComponent(getenv('COMPONENT_APP_ID'), getenv('COMPONENT_APP_SECRET'),
-                          getenv('COMPONENT_MSG_TOKEN'), getenv('COMPONENT_MSG_KEY'))
+component = LazyProxy(lambda: WXOPComponent(getenv('COMPONENT_APP_ID'), getenv('COMPONENT_APP_SECRET'),
+                                            getenv('COMPONENT_MSG_TOKEN'), getenv('COMPONENT_MSG_KEY')))
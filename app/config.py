@@ -1,19 +1,23 @@
-from logging import Formatter
 from os import getenv
 
 from flask import Flask
 from flask.logging import default_handler
 
-from .hooks import before_app_request, teardown_app_request
+from utils.log_util import RequestContextFilter, create_queue_handler, create_stream_handler
+from .admission import admission
+from .hooks import after_app_request, before_app_request, teardown_app_request
+from .metrics import metrics
 from .misc import CustomJSONEncoder
 from .blueprints.admin_api import bp_admin_api
 from .blueprints.admin_ext import bp_admin_ext
+from .blueprints.health import bp_health
 
 
 class Config:
     """配置"""
 
     SERVER_NAME = getenv('SERVER_NAME')
+    SECRET_KEY = getenv('SECRET_KEY')  # 签名密钥（游标分页等），不能与AES_KEY_SEED相同
 
     # blueprint
     BP_SUB_DOMAIN = {
@@ -27,13 +31,24 @@ class Config:
     @classmethod
     def init_app(cls, app: Flask) -> None:
         """初始化flask应用对象"""
+        if not cls.SECRET_KEY:
+            raise RuntimeError('SECRET_KEY is not set')
+        if cls.SECRET_KEY == getenv('AES_KEY_SEED'):
+            raise RuntimeError('SECRET_KEY must differ from AES_KEY_SEED')
         log_level = getenv('LOG_LEVEL') or 'INFO'
+        log_handler = create_queue_handler(create_stream_handler((getenv('LOG_FORMAT') or 'json') == 'json'))
+        log_handler.setLevel(log_level)
+        log_handler.addFilter(RequestContextFilter())
         app.logger.setLevel(log_level)
-        default_handler.setLevel(log_level)
-        default_handler.setFormatter(Formatter('[%(asctime)s] %(pathname)s:%(lineno)d [%(levelname)s] %(message)s'))
+        app.logger.removeHandler(default_handler)
+        app.logger.addHandler(log_handler)
+        admission.init_app(app)
+        metrics.init_app(app)
         app.before_request(before_app_request)
+        app.after_request(after_app_request)
         app.teardown_request(teardown_app_request)
         app.json_encoder = CustomJSONEncoder
         sub, url = cls.BP_SUB_DOMAIN, cls.BP_URL_PREFIX
         app.register_blueprint(bp_admin_api, subdomain=sub.get('admin'), url_prefix=url.get('admin_api'))
         app.register_blueprint(bp_admin_ext, subdomain=sub.get('admin'), url_prefix=url.get('admin_ext'))
+        app.register_blueprint(bp_health)
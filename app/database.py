@@ -0,0 +1,248 @@
+import sys
+from collections import Counter
+from logging import Logger, getLogger
+from os import getenv
+from os.path import abspath, dirname, join
+from random import random
+from time import perf_counter, time
+from typing import Callable, Iterator, Optional
+
+from flask import current_app, g, has_app_context
+from peewee import SENTINEL, MySQLDatabase
+from playhouse.pool import MaxConnectionsExceeded, PooledMySQLDatabase
+from pymysql.cursors import SSCursor
+
+
+class MySQLPool(PooledMySQLDatabase):
+    """MySQL连接池
+
+    连接状态保存在threading.local中，在eventlet worker下（monkey patch后）即为greenlet隔离；
+    连接池已满时，checkout会以time.sleep轮询等待（同样是协作式的），直到超时。
+    连接在第一次执行SQL时才checkout（peewee自动连接），请求结束时归还。
+
+    配置了只读副本时，请求内的SELECT（不在事务中、非加锁读）路由到副本；
+    请求内一旦执行过写语句，该请求余下的SQL都走主库，保证读到自己的写入。
+    请求上下文之外（huey任务、脚本）的SQL一律走主库。
+    """
+
+    def __init__(self, database: str, *, ping_interval: float=30, replica: 'MySQLPool'=None, **kwargs):
+        """Initializer
+
+        Args:
+            database: 数据库名
+            ping_interval: 归还后空闲超过该秒数的连接，在checkout时才ping检查存活
+            replica: 只读副本的连接池
+            kwargs: max_connections（最大连接数）、stale_timeout（连接回收秒数）、
+                timeout（checkout等待超时秒数）及其他MySQL连接参数
+        """
+        super().__init__(database, **kwargs)
+        self.replica = replica
+        self.query_hooks = []  # 每条SQL执行后调用：hook(sql, params, elapsed)
+        self._ping_interval = ping_interval
+        self._checkin_time = {}
+        self._checkout_count = 0
+        self._wait_count = 0
+        self._wait_time = 0.0
+        self._max_wait_time = 0.0
+        self._timeout_count = 0
+        self._request_count = 0
+        self._db_free_request_count = 0
+
+    def connect(self, reuse_if_open: bool=False) -> bool:
+        start = time()
+        try:
+            ret = super().connect(reuse_if_open)
+        except MaxConnectionsExceeded:
+            self._timeout_count += 1
+            raise
+        if ret:
+            wait_time = time() - start
+            self._checkout_count += 1
+            self._wait_time += wait_time
+            if wait_time >= 0.1:
+                self._wait_count += 1
+            if wait_time > self._max_wait_time:
+                self._max_wait_time = wait_time
+        return ret
+
+    def close(self) -> bool:
+        if self.replica is not None:
+            self.replica.close()
+        return super().close()
+
+    def add_query_hook(self, hook: Callable[[str, tuple, float], None]) -> None:
+        """注册SQL执行后的钩子函数"""
+        self.query_hooks.append(hook)
+
+    def execute_sql(self, sql, params=None, commit=SENTINEL):
+        start = perf_counter()
+        try:
+            return self._execute_sql(sql, params, commit)
+        finally:
+            elapsed = perf_counter() - start
+            for hook in self.query_hooks:
+                hook(sql, params, elapsed)
+
+    def _execute_sql(self, sql, params, commit):
+        if has_app_context():
+            g.db_queries = g.get('db_queries', 0) + 1  # g.db_queries
+            if self.replica is not None and not g.get('db_sticky'):
+                if self._is_replica_read(sql):
+                    return super(MySQLPool, self.replica).execute_sql(sql, params, commit)
+                g.db_sticky = True  # g.db_sticky（本请求已写主库）
+        return super().execute_sql(sql, params, commit)
+
+    def iter_unbuffered(self, query) -> Iterator:
+        """以无缓冲游标（SSCursor）逐行读取查询结果，内存占用与结果集大小无关
+
+        使用单独建立的连接（有只读副本时连接副本），不经过连接池的checkout（不计入max_connections），
+        也不占用当前请求的连接，迭代过程中仍可执行其他SQL；读完或迭代中断（生成器关闭）时关闭连接。
+        """
+        database = self.replica if self.replica is not None else self
+        sql, params = query.sql()
+        conn = MySQLDatabase._connect(database)  # PooledDatabase._connect会登记到连接池的_in_use
+        try:
+            cursor = conn.cursor(SSCursor)
+            start = perf_counter()
+            try:
+                cursor.execute(sql, params)
+            finally:
+                elapsed = perf_counter() - start
+                if has_app_context():
+                    g.db_queries = g.get('db_queries', 0) + 1  # g.db_queries
+                for hook in self.query_hooks:
+                    hook(sql, params, elapsed)
+            yield from query._get_cursor_wrapper(cursor).iterator()
+        finally:
+            conn.close()  # 不读取剩余的行
+
+    def _is_replica_read(self, sql: str) -> bool:
+        """是否为可以路由到只读副本的SQL"""
+        if self.in_transaction() or not sql[:6].lower().startswith('select'):
+            return False
+        tail = sql[-32:].upper()
+        return 'FOR UPDATE' not in tail and 'SHARE MODE' not in tail
+
+    def count_request(self, queries: int) -> None:
+        """记录一次请求（及其执行的SQL数）"""
+        self._request_count += 1
+        if not queries:
+            self._db_free_request_count += 1
+
+    def _is_closed(self, conn) -> bool:
+        checkin_time = self._checkin_time.pop(self.conn_key(conn), 0)
+        if time() - checkin_time < self._ping_interval:
+            return False
+        return super()._is_closed(conn)
+
+    def _close(self, conn, close_conn: bool=False) -> None:
+        key = self.conn_key(conn)
+        super()._close(conn, close_conn)
+        if not close_conn and any(self.conn_key(c) == key for _, c in self._connections):
+            self._checkin_time[key] = time()  # 归还到连接池
+        else:
+            self._checkin_time.pop(key, None)  # 已关闭（包括超过stale_timeout或不可重用的连接）
+
+    def pool_stats(self) -> dict:
+        """连接池统计"""
+        return {
+            'max_connections': self._max_connections,
+            'in_use': len(self._in_use),
+            'idle': len(self._connections),
+            'checkouts': self._checkout_count,
+            'waits': self._wait_count,
+            'timeouts': self._timeout_count,
+            'wait_time': round(self._wait_time, 6),
+            'max_wait_time': round(self._max_wait_time, 6),
+            'requests': self._request_count,
+            'db_free_requests': self._db_free_request_count,
+            'replica': self.replica.pool_stats() if self.replica is not None else None
+        }
+
+
+def _create_pool(host: str, port: int, replica: Optional[MySQLPool]=None) -> MySQLPool:
+    return MySQLPool(
+        getenv('MYSQL_DB') or 'code_life_test',
+        user=getenv('MYSQL_USER'),
+        password=getenv('MYSQL_PASSWORD'),
+        host=host,
+        port=port,
+        charset='utf8mb4',
+        max_connections=int(getenv('MYSQL_MAX_CONNECTIONS') or 10),
+        stale_timeout=int(getenv('MYSQL_STALE_TIMEOUT') or 300),
+        timeout=int(getenv('MYSQL_POOL_TIMEOUT') or 10),
+        ping_interval=int(getenv('MYSQL_PING_INTERVAL') or 30),
+        replica=replica
+    )
+
+
+_replica_host = getenv('MYSQL_REPLICA_HOST')
+db = _create_pool(
+    getenv('MYSQL_HOST') or '127.0.0.1',
+    int(getenv('MYSQL_PORT') or 3306),
+    replica=_create_pool(_replica_host, int(getenv('MYSQL_REPLICA_PORT') or 3306)) if _replica_host else None
+)
+
+
+class QueryInspector:
+    """SQL检查：慢查询日志 & N+1查询检测
+
+    - 慢查询：耗时超过slow_query_ms的SQL，记录SQL、参数和调用位置（始终开启）
+    - N+1：同一请求内相同的SQL（参数化后的语句）执行次数达到repeat_threshold时记录一次；
+      按请求抽样（sample_rate，开发环境可设为1）
+    """
+
+    _ROOT = dirname(dirname(abspath(__file__)))
+    _SKIPPED = (abspath(__file__), join(_ROOT, 'app', 'metrics.py'))
+
+    def __init__(self, slow_query_ms: float=200, repeat_threshold: int=5, sample_rate: float=0):
+        """Initializer
+
+        Args:
+            slow_query_ms: 慢查询阈值（毫秒），0表示不记录
+            repeat_threshold: 同一请求内相同SQL的次数阈值，0表示不检测
+            sample_rate: 检测N+1的请求比例（0~1）
+        """
+        self.slow_query_ms = slow_query_ms
+        self.repeat_threshold = repeat_threshold
+        self.sample_rate = sample_rate
+
+    def __call__(self, sql: str, params: tuple, elapsed: float) -> None:
+        if self.slow_query_ms and elapsed * 1000 >= self.slow_query_ms:
+            self._logger().warning('Slow query ({0:.1f}ms) at {1}: {2} {3!r}'.format(
+                elapsed * 1000, self._caller(), sql, params))
+        if not (self.repeat_threshold and self.sample_rate > 0 and has_app_context()):
+            return
+        shapes = g.get('db_shapes')
+        if shapes is None:
+            if random() >= self.sample_rate:
+                g.db_shapes = False  # g.db_shapes（本请求不抽样）
+                return
+            shapes = g.db_shapes = Counter()
+        elif shapes is False:
+            return
+        shapes[sql] += 1
+        if shapes[sql] == self.repeat_threshold:
+            self._logger().warning('N+1 query suspected ({0}x) at {1}: {2}'.format(
+                self.repeat_threshold, self._caller(), sql))
+
+    @staticmethod
+    def _logger() -> Logger:
+        return current_app.logger if has_app_context() else getLogger(__name__)
+
+    def _caller(self) -> str:
+        """项目代码中最近的调用位置"""
+        frame = sys._getframe(2)
+        while frame is not None:
+            filename = frame.f_code.co_filename
+            if filename.startswith(self._ROOT) and filename not in self._SKIPPED and 'site-packages' not in filename:
+                return '{0}:{1} {2}'.format(filename[len(self._ROOT) + 1:], frame.f_lineno, frame.f_code.co_name)
+            frame = frame.f_back
+        return '?'
+
+
+db.add_query_hook(QueryInspector(
+    slow_query_ms=float(getenv('DB_SLOW_QUERY_MS') or 200),
+    repeat_threshold=int(getenv('DB_REPEAT_QUERY_THRESHOLD') or 5),
+    sample_rate=float(getenv('DB_INSPECT_SAMPLE_RATE') or 0)
+))
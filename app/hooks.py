@@ -1,5 +1,10 @@
-from flask import abort, current_app, g, request
+from logging import DEBUG
+from time import perf_counter
+from uuid import uuid4
 
+from flask import Response, abort, current_app, g, request
+
+from utils.log_util import format_body, redact
 from .models import db
 
 
@@ -9,13 +14,32 @@ def before_app_request() -> None:
     Raises:
         werkzeug.exceptions.NotFound
     """
+    g.request_start = perf_counter()  # g.request_start
+    g.request_id = request.headers.get('X-Request-Id', '')[:64] or uuid4().hex  # g.request_id
     if not request.blueprint:
         abort(404)
-    current_app.logger.debug('{0.method} {0.full_path} {0.headers!r} {0.data!r}'.format(request))
+    if current_app.logger.isEnabledFor(DEBUG):
+        if request.is_json:
+            data = format_body(request.get_json(silent=True))
+        elif request.form:
+            data = format_body(request.form.to_dict())
+        else:
+            data = format_body(request.get_data())
+        current_app.logger.debug('{0.method} {0.full_path} {1} {2}'.format(request, redact(dict(request.headers)), data))
     g.ip = request.headers.get('X-Forwarded-For') or request.headers.get('X-Real-Ip')  # g.ip
-    db.connect(reuse_if_open=True)
+    g.db_queries = 0  # g.db_queries（数据库连接在第一次执行SQL时才建立）
+
+
+def after_app_request(response: Response) -> Response:
+    """请求后全局钩子函数"""
+    if 'request_id' in g:
+        response.headers['X-Request-Id'] = g.request_id
+    return response
 
 
 def teardown_app_request(e: Exception=None) -> None:
     """请求后全局钩子函数"""
     db.close()
+    queries = g.get('db_queries', 0)
+    db.count_request(queries)
+    current_app.logger.debug('{0} db_queries={1}'.format(request.endpoint, queries))
@@ -0,0 +1,228 @@
+from collections import defaultdict
+from os import getenv, getpid
+from re import compile
+from socket import gethostname
+from time import monotonic, perf_counter
+from typing import Callable, Dict, Iterable, Tuple
+
+from flask import Flask, Response, current_app, g, has_app_context, request
+from requests import PreparedRequest
+
+from utils.http_util import http_client
+from utils.redis_util import credential_cache, redis_client
+from .database import db
+from .models import Admin
+
+
+Sample = Tuple[str, Dict[str, str], float]  # (指标名, 标签, 值)
+
+_LE_PATTERN = compile(r'le="([^"]*)"')
+
+
+def _sample_key(name: str, labels: dict) -> str:
+    """Prometheus样本的文本表示（不含值），如：name{a="1",b="2"}"""
+    if not labels:
+        return name
+    items = ','.join('{0}="{1}"'.format(k, str(v).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n'))
+                     for k, v in sorted(labels.items()))
+    return '{0}{{{1}}}'.format(name, items)
+
+
+def _sort_key(sample: Tuple[str, float]) -> Tuple[str, float]:
+    """样本的排序键：同一序列的histogram桶按le的数值升序（+Inf在最后）"""
+    key = sample[0]
+    match = _LE_PATTERN.search(key)
+    if match is None:
+        return key, 0
+    return key[:match.start()] + 'le=""' + key[match.end():], float(match.group(1))
+
+
+class Metrics:
+    """指标（Prometheus文本格式）
+
+    counter、histogram先在进程内累加，每隔flush_interval秒以一次pipeline（HINCRBYFLOAT）汇总到Redis，
+    所有gunicorn worker共用；gauge由注册的收集函数在flush时采集，按worker分别写入Redis并设置过期时间。
+    """
+
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self, prefix: str='metrics', flush_interval: float=10):
+        """Initializer
+
+        Args:
+            prefix: Redis键前缀
+            flush_interval: 汇总到Redis的间隔（秒）
+        """
+        self.prefix = prefix
+        self.flush_interval = flush_interval
+        self.worker = '{0}:{1}'.format(gethostname(), getpid())
+        self._families = {}  # 指标名 -> (类型, 说明)
+        self._pending = defaultdict(float)
+        self._collectors = []
+        self._last_flush = monotonic()
+
+    def describe(self, name: str, metric_type: str, help_text: str) -> None:
+        """声明指标的类型（counter/gauge/histogram）和说明"""
+        self._families[name] = (metric_type, help_text)
+
+    def inc(self, name: str, value: float=1, **labels) -> None:
+        """counter增加"""
+        self._pending[_sample_key(name, labels)] += value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        """histogram记录一次观测值"""
+        pending = self._pending
+        for bucket in self.BUCKETS:
+            if value <= bucket:
+                pending[_sample_key(name + '_bucket', dict(labels, le=bucket))] += 1
+        pending[_sample_key(name + '_bucket', dict(labels, le='+Inf'))] += 1
+        pending[_sample_key(name + '_sum', labels)] += value
+        pending[_sample_key(name + '_count', labels)] += 1
+
+    def collector(self, func: Callable[[], Iterable[Sample]]) -> Callable[[], Iterable[Sample]]:
+        """注册gauge收集函数（可用作装饰器）"""
+        self._collectors.append(func)
+        return func
+
+    def flush(self, force: bool=False) -> None:
+        """汇总到Redis（未到间隔时间且force为假时跳过）"""
+        now = monotonic()
+        if not force and now - self._last_flush < self.flush_interval:
+            return
+        self._last_flush = now
+        pending, self._pending = self._pending, defaultdict(float)
+        gauges = {}
+        for func in self._collectors:
+            for name, labels, value in func():
+                gauges[_sample_key(name, dict(labels, worker=self.worker))] = value
+        gauge_key = '{0}:gauges:{1}'.format(self.prefix, self.worker)
+        pipe = redis_client.pipeline(transaction=False)
+        for key, value in pending.items():
+            pipe.hincrbyfloat('{0}:counters'.format(self.prefix), key, value)
+        if gauges:
+            pipe.delete(gauge_key)
+            pipe.hmset(gauge_key, gauges)
+            pipe.expire(gauge_key, int(self.flush_interval * 3))
+            pipe.sadd('{0}:workers'.format(self.prefix), gauge_key)
+        try:
+            pipe.execute()
+        except Exception as e:
+            for key, value in pending.items():
+                self._pending[key] += value
+            current_app.logger.error(e)
+
+    def render(self) -> str:
+        """从Redis读取所有worker的汇总数据，转换为Prometheus文本格式"""
+        samples = {k.decode(): float(v) for k, v in redis_client.hgetall('{0}:counters'.format(self.prefix)).items()}
+        workers_key = '{0}:workers'.format(self.prefix)
+        for gauge_key in redis_client.smembers(workers_key):
+            values = redis_client.hgetall(gauge_key)
+            if not values:
+                redis_client.srem(workers_key, gauge_key)
+            samples.update((k.decode(), float(v)) for k, v in values.items())
+
+        families = defaultdict(list)
+        for key, value in samples.items():
+            name = key.split('{', 1)[0]
+            for suffix in ['_bucket', '_sum', '_count']:
+                if name.endswith(suffix) and name[:-len(suffix)] in self._families:
+                    name = name[:-len(suffix)]
+                    break
+            families[name].append((key, value))
+        lines = []
+        for name in sorted(families):
+            metric_type, help_text = self._families.get(name, ('untyped', ''))
+            lines.append('# HELP {0} {1}'.format(name, help_text))
+            lines.append('# TYPE {0} {1}'.format(name, metric_type))
+            lines.extend('{0} {1:g}'.format(k, v) for k, v in sorted(families[name], key=_sort_key))
+        return '\n'.join(lines) + '\n'
+
+    def init_app(self, app: Flask) -> None:
+        """注册请求钩子，统计每个endpoint的耗时、SQL、Redis和出站HTTP"""
+        app.before_request(_before_request)
+        app.after_request(_after_request)
+        app.teardown_request(_teardown_request)
+        db.add_query_hook(_on_query)
+        redis_client.command_hooks.append(_on_redis_command)
+        http_client.send_hooks.append(_on_http_send)
+
+
+metrics = Metrics(flush_interval=int(getenv('METRICS_FLUSH_INTERVAL') or 10))
+metrics.describe('http_request_duration_seconds', 'histogram', '请求耗时')
+metrics.describe('http_requests_total', 'counter', '请求数')
+metrics.describe('http_request_db_queries_total', 'counter', 'SQL执行次数')
+metrics.describe('http_request_db_seconds_total', 'counter', 'SQL累计耗时')
+metrics.describe('http_request_redis_calls_total', 'counter', 'Redis命令数')
+metrics.describe('http_request_outbound_seconds_total', 'counter', '出站HTTP累计耗时')
+metrics.describe('rate_limit_total', 'counter', '限流检查次数')
+metrics.describe('db_pool', 'gauge', 'MySQL连接池统计')
+metrics.describe('admin_token_cache', 'gauge', '管理员身份令牌缓存统计')
+metrics.describe('credential_cache', 'gauge', '微信凭据两级缓存统计')
+
+
+def _before_request() -> None:
+    g.metrics_start = perf_counter()  # g.metrics_start
+    g.db_time = 0.0  # g.db_time
+    g.redis_calls = 0  # g.redis_calls
+    g.http_time = 0.0  # g.http_time
+
+
+def _after_request(response: Response) -> Response:
+    g.status_code = response.status_code  # g.status_code
+    return response
+
+
+def _teardown_request(e: Exception=None) -> None:
+    start = g.get('metrics_start')
+    if start is None:
+        return
+    endpoint = request.endpoint or 'none'
+    metrics.observe('http_request_duration_seconds', perf_counter() - start, endpoint=endpoint)
+    metrics.inc('http_requests_total', endpoint=endpoint, status=g.get('status_code', 500))
+    metrics.inc('http_request_db_queries_total', g.get('db_queries', 0), endpoint=endpoint)
+    metrics.inc('http_request_db_seconds_total', g.db_time, endpoint=endpoint)
+    metrics.inc('http_request_redis_calls_total', g.redis_calls, endpoint=endpoint)
+    metrics.inc('http_request_outbound_seconds_total', g.http_time, endpoint=endpoint)
+    metrics.flush()
+
+
+def _on_query(sql: str, params: tuple, elapsed: float) -> None:
+    if has_app_context():
+        g.db_time = g.get('db_time', 0.0) + elapsed
+
+
+def _on_redis_command(command: str) -> None:
+    if has_app_context():
+        g.redis_calls = g.get('redis_calls', 0) + 1
+
+
+def _on_http_send(request: PreparedRequest, elapsed: float) -> None:
+    if has_app_context():
+        g.http_time = g.get('http_time', 0.0) + elapsed
+
+
+@metrics.collector
+def _collect_db_pool() -> Iterable[Sample]:
+    stats = db.pool_stats()
+    for pool, pool_stats in [('primary', stats), ('replica', stats.pop('replica'))]:
+        if pool_stats:
+            for key in ['in_use', 'idle', 'checkouts', 'waits', 'timeouts', 'wait_time', 'max_wait_time']:
+                yield 'db_pool', {'pool': pool, 'stat': key}, pool_stats[key]
+
+
+@metrics.collector
+def _collect_admin_token_cache() -> Iterable[Sample]:
+    stats = Admin.token_cache_stats()
+    local = stats['local']
+    for key, value in [('local_hits', local['hits']), ('local_misses', local['misses']),
+                       ('redis_hits', stats['redis_hits']), ('redis_misses', stats['redis_misses'])]:
+        yield 'admin_token_cache', {'stat': key}, value
+
+
+@metrics.collector
+def _collect_credential_cache() -> Iterable[Sample]:
+    stats = credential_cache.stats()
+    local = stats['local']
+    for key, value in [('local_hits', local['hits']), ('local_misses', local['misses']), ('local_size', local['size']),
+                       ('redis_hits', stats['redis_hits']), ('redis_misses', stats['redis_misses'])]:
+        yield 'credential_cache', {'stat': key}, value
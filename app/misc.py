@@ -1,22 +1,143 @@
-from datetime import date
+from datetime import date, datetime
 from decimal import Decimal
+from json import dumps as std_dumps
+from math import isfinite
+from os import getenv
+from types import GeneratorType
+from typing import Any, Callable, Dict
+from uuid import UUID
 
+from flask import Response, current_app
 from flask.json import JSONEncoder
+from peewee import Model
+
+try:
+    import orjson
+except ImportError:  # 可选依赖
+    orjson = None
+
+
+def _convert_decimal(o: Decimal):
+    f = float(o)
+    return int(f) if f.is_integer() else f
+
+
+def _convert_model(o: Model) -> dict:
+    return o.to_dict()
+
+
+def _convert_fallback(o):
+    return JSONEncoder.default(None, o)  # flask的默认处理（dataclass、__html__等），失败时抛出TypeError
+
+
+# 类型 -> 转换函数；未登记的类型在第一次遇到时按MRO解析并登记
+_CONVERTERS: Dict[type, Callable[[Any], Any]] = {
+    date: date.isoformat,
+    datetime: datetime.isoformat,
+    Decimal: _convert_decimal,
+    UUID: str,
+    set: list,
+    frozenset: list,
+    GeneratorType: list
+}
+
+
+def _resolve_converter(cls: type) -> Callable[[Any], Any]:
+    for base in cls.__mro__:
+        converter = _CONVERTERS.get(base)
+        if converter is not None:
+            break
+    else:
+        if issubclass(cls, Model):
+            converter = _convert_model
+        elif hasattr(cls, '__iter__'):
+            converter = list
+        else:
+            converter = _convert_fallback
+    _CONVERTERS[cls] = converter
+    return converter
+
+
+def json_default(o):
+    """JSON编码时非原生类型的转换（按类型查表）"""
+    converter = _CONVERTERS.get(o.__class__) or _resolve_converter(o.__class__)
+    return converter(o)
+
+
+def _str_key(key) -> str:
+    """dict键转换为字符串（与orjson的OPT_NON_STR_KEYS一致）"""
+    if isinstance(key, str):
+        return key
+    if key is None or isinstance(key, (bool, int, float)):
+        return std_dumps(key)
+    value = json_default(key)
+    return value if isinstance(value, str) else str(value)
+
+
+def _orjson_compatible(obj):
+    """递归地将dict的键转换为字符串、非有限的浮点数（NaN、Infinity）转换为None（与orjson一致）"""
+    if isinstance(obj, dict):
+        return {_str_key(k): _orjson_compatible(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_orjson_compatible(v) for v in obj]
+    if isinstance(obj, float) and not isfinite(obj):
+        return None
+    return obj
+
+
+def _orjson_compatible_default(o):
+    return _orjson_compatible(json_default(o))
 
 
 class CustomJSONEncoder(JSONEncoder):
-    """自定义JSONEncoder"""
+    """自定义JSONEncoder：flask的jsonify、json.dumps等也通过json_backend编码
+
+    json_backend的输出固定为紧凑格式、不转义非ASCII字符，调用方要求其他格式时（JSON_AS_ASCII为True、缩进、
+    自定义分隔符、skipkeys等）仍由标准库编码。
+    """
 
     def default(self, o):
-        if isinstance(o, date):
-            return o.isoformat()
-        if isinstance(o, Decimal):
-            f = float(o)
-            return int(f) if f.is_integer() else f
+        return json_default(o)
+
+    def encode(self, o) -> str:
+        if (self.ensure_ascii or self.indent is not None or self.skipkeys
+                or self.item_separator != ',' or self.key_separator != ':'):
+            return super().encode(o)
+        return json_backend.dumps(o, sort_keys=self.sort_keys).decode('utf-8')
+
+
+class JSONBackend:
+    """JSON编码后端：orjson（已安装时，C实现）或标准库json"""
+
+    def __init__(self, name: str=None):
+        """Initializer
+
+        Args:
+            name: 'orjson'或'json'，默认已安装orjson时使用orjson
+        """
+        if name is None:
+            name = 'orjson' if orjson is not None else 'json'
+        if name == 'orjson' and orjson is None:
+            raise RuntimeError('orjson is not installed')
+        self.name = name
+
+    def dumps(self, obj, *, sort_keys: bool=None) -> bytes:
+        """编码为UTF-8的bytes"""
+        if sort_keys is None:
+            sort_keys = current_app.config['JSON_SORT_KEYS']
+        if self.name == 'orjson':
+            option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_SORT_KEYS if sort_keys else 0)
+            return orjson.dumps(obj, default=json_default, option=option)
         try:
-            iterator = iter(o)
-        except TypeError:
-            pass
-        else:
-            return list(iterator)
-        return super().default(o)
+            return std_dumps(obj, default=json_default, sort_keys=sort_keys, separators=(',', ':'),
+                             ensure_ascii=False, allow_nan=False).encode('utf-8')
+        except (TypeError, ValueError):  # 键的类型不能排序或不被支持、含NaN等（orjson可以），转换后重试
+            return std_dumps(_orjson_compatible(obj), default=_orjson_compatible_default, sort_keys=sort_keys,
+                             separators=(',', ':'), ensure_ascii=False, allow_nan=False).encode('utf-8')
+
+    def response(self, obj, status: int=200) -> Response:
+        """JSON响应"""
+        return current_app.response_class(self.dumps(obj), status=status, mimetype='application/json')
+
+
+json_backend = JSONBackend(getenv('JSON_BACKEND') or None)
@@ -1,32 +1,30 @@
 from __future__ import annotations
 from datetime import datetime
+from hashlib import sha1
+from logging import getLogger
 from json import dumps, loads
 from os import getenv
 from time import time
-from typing import Iterable, Optional, Type, TypeVar, Union, List, Generator
+from typing import Iterable, Optional, Tuple, Type, TypeVar, Union, List, Generator
 from uuid import uuid4
 
-import requests
 from flask import current_app, json
 from peewee import *
-from werkzeug.security import check_password_hash, generate_password_hash
 
 from app.component import component
-from utils.redis_util import redis_client
-from utils.string_util import nullable_strip, to_str
+from utils.http_util import http_client, parse_json
+from utils.redis_util import TwoTierCache, get_or_refresh, redis_client
+from utils.security_util import hash_password, password_needs_rehash, verify_password
+from utils.string_util import nullable_strip, to_bytes, to_str
 from .api_utils import APIError
+from .database import db
 from utils.aes_util import aes_crypto
 
 
-db = MySQLDatabase(
-    getenv('MYSQL_DB') or 'code_life_test',
-    user=getenv('MYSQL_USER'),
-    password=getenv('MYSQL_PASSWORD'),
-    host=getenv('MYSQL_HOST') or '127.0.0.1',
-    port=int(getenv('MYSQL_PORT') or 3306),
-    charset='utf8mb4'
-)
 T = TypeVar('T', bound='_BaseModel')
+_to_dict_plans = {}
+_admin_token_cache = TwoTierCache(redis_client, 'cache:invalidate:admin_tokens',
+                                  local_ttl=int(getenv('ADMIN_TOKEN_LOCAL_TTL') or 10), loads=loads)
 
 
 class _JSONCharField(CharField):
@@ -92,6 +90,30 @@ class _BaseModel(Model):
         """转换为dict时额外增加的属性名"""
         return set()
 
+    @classmethod
+    def _to_dict_plan(cls, only: Iterable[str]=None, exclude: Iterable[str]=None, recurse: bool=False,
+                      max_depth: int=None) -> tuple:
+        """to_dict的字段计划：((字段名, 是否递归转换), ...), (额外属性名, ...), 外键的递归深度
+
+        每种(model, only, exclude, recurse, max_depth)组合只计算一次。
+        """
+        key = (cls, frozenset(only or ()), frozenset(exclude or ()), recurse, max_depth)
+        plan = _to_dict_plans.get(key)
+        if plan is None:
+            only = set(only or [])
+            exclude = set(exclude or []) | cls._excluded_field_names()
+            if max_depth is None:
+                max_depth = -1
+            if max_depth == 0:
+                recurse = False
+            fields = tuple((field_name, recurse and isinstance(field, ForeignKeyField))
+                           for field_name, field in cls._meta.fields.items()
+                           if field_name not in exclude and (not only or field_name in only))
+            extras = tuple(attr_name for attr_name in cls._extra_attr_names()
+                           if attr_name not in exclude and (not only or attr_name in only))
+            plan = _to_dict_plans[key] = (fields, extras, max_depth - 1)
+        return plan
+
     def to_dict(self, *, only: Iterable[str]=None, exclude: Iterable[str]=None, recurse: bool=False,
                 max_depth: int=None) -> dict:
         """转换为dict
@@ -102,35 +124,77 @@ class _BaseModel(Model):
             recurse: 是否对外键进行递归转换
             max_depth: 递归深度，默认无限制
         """
-        only = set(only or [])
-        exclude = set(exclude or []) | self._excluded_field_names()
-        if max_depth is None:
-            max_depth = -1
-        if max_depth == 0:
-            recurse = False
+        fields, extras, rel_max_depth = self._to_dict_plan(only, exclude, recurse, max_depth)
+        values = self.__data__
         data = {}
 
         # fields
-        for field_name, field in self._meta.fields.items():
-            if field_name in exclude or (only and field_name not in only):
-                continue
-            field_data = self.__data__.get(field_name)
-            if recurse and isinstance(field, ForeignKeyField):
+        for field_name, recurse_field in fields:
+            field_data = values.get(field_name)
+            if recurse_field:
                 if field_data:
                     rel_obj = getattr(self, field_name)
-                    field_data = rel_obj.to_dict(recurse=True, max_depth=max_depth - 1)
+                    field_data = rel_obj.to_dict(recurse=True, max_depth=rel_max_depth)
                 else:
                     field_data = None
             data[field_name] = field_data
 
         # extras
-        for attr_name in self._extra_attr_names():
-            if attr_name in exclude or (only and attr_name not in only):
-                continue
+        for attr_name in extras:
             attr = getattr(self, attr_name)
             data[attr_name] = attr() if callable(attr) else attr
         return data
 
+    @classmethod
+    def prefetch_foreign_keys(cls, objs: List[T], *, only: Iterable[str]=None, exclude: Iterable[str]=None,
+                              max_depth: int=None) -> List[T]:
+        """批量查询外键关联对象（每个外键一条SQL），之后to_dict(recurse=True)不再逐行查询
+
+        Args:
+            objs: 同一模型的对象列表
+            only: 仅包含在内的字段名列表
+            exclude: 排除在外的字段名列表
+            max_depth: 递归深度，默认无限制
+        """
+        if not objs or max_depth == 0:
+            return objs
+        only = set(only or [])
+        exclude = set(exclude or []) | cls._excluded_field_names()
+        for field_name, field in cls._meta.fields.items():
+            if not isinstance(field, ForeignKeyField) or field_name in exclude or (only and field_name not in only):
+                continue
+            ids = {obj.__data__.get(field_name) for obj in objs} - {None}
+            if not ids:
+                continue
+            rel_model, rel_field = field.rel_model, field.rel_field
+            rel_objs = {getattr(rel_obj, rel_field.name): rel_obj
+                        for rel_obj in rel_model.select().where(rel_field.in_(list(ids)))}
+            for obj in objs:
+                rel_obj = rel_objs.get(obj.__data__.get(field_name))
+                if rel_obj is not None:
+                    obj.__rel__[field_name] = rel_obj
+            if issubclass(rel_model, _BaseModel):
+                rel_model.prefetch_foreign_keys(list(rel_objs.values()),
+                                                max_depth=None if max_depth is None else max_depth - 1)
+        return objs
+
+    @classmethod
+    def to_dict_list(cls, objs: Iterable[T], *, only: Iterable[str]=None, exclude: Iterable[str]=None,
+                     recurse: bool=False, max_depth: int=None) -> List[dict]:
+        """批量转换为dict，recurse时先批量查询外键关联对象
+
+        Args:
+            objs: 同一模型的对象列表（或查询）
+            only: 仅包含在内的字段名列表
+            exclude: 排除在外的字段名列表
+            recurse: 是否对外键进行递归转换
+            max_depth: 递归深度，默认无限制
+        """
+        objs = list(objs)
+        if recurse:
+            cls.prefetch_foreign_keys(objs, only=only, exclude=exclude, max_depth=max_depth)
+        return [obj.to_dict(only=only, exclude=exclude, recurse=recurse, max_depth=max_depth) for obj in objs]
+
     def save(self, lock_ut: bool=False, **kwargs) -> int:
         """持久化到数据库
 
@@ -210,7 +274,7 @@ class Admin(_BaseModel, _UUIDMixin, _LoginMixin):
         """创建管理员"""
         return cls.create(
             username=username,
-            password=generate_password_hash(password)
+            password=hash_password(password)
         )
 
     @classmethod
@@ -223,7 +287,23 @@ class Admin(_BaseModel, _UUIDMixin, _LoginMixin):
 
     @classmethod
     def get_by_token(cls, token: str) -> Optional[Admin]:
-        """根据身份令牌获取"""
+        """根据身份令牌获取
+
+        验证通过的身份令牌 -> Admin快照（不含密码，JSON），依次缓存在进程内（ADMIN_TOKEN_LOCAL_TTL）和Redis中
+        （ADMIN_TOKEN_CACHE_TTL），命中时无需AES解密和查询数据库。管理员保存或删除时通过pub/sub使所有worker的缓存失效。
+        """
+        key = sha1(to_bytes(token)).hexdigest()
+        entry = _admin_token_cache.get('admin:token:{0}'.format(key))
+        if entry is None:
+            return cls._get_by_token(key, token)
+        if entry['expires'] > time():
+            admin = cls(__no_default__=True)
+            admin.__data__.update({k: cls._meta.fields[k].python_value(v) for k, v in entry['data'].items()})
+            return admin
+
+    @classmethod
+    def _get_by_token(cls, key: str, token: str) -> Optional[Admin]:
+        """解密身份令牌并查询，结果写入缓存"""
         try:
             text = aes_crypto.decrypt(token)
             _uuid, expires = text.split(':')
@@ -231,8 +311,46 @@ class Admin(_BaseModel, _UUIDMixin, _LoginMixin):
         except Exception as e:
             current_app.logger.error(e)
         else:
-            if expires > time():
-                return cls.get_by_uuid(_uuid)
+            cache_ttl = int(getenv('ADMIN_TOKEN_CACHE_TTL') or 300)
+            ttl = min(cache_ttl, expires - int(time()))
+            if ttl > 0:
+                admin = cls.get_by_uuid(_uuid)
+                if admin:
+                    data = {k: v for k, v in admin.__data__.items() if k != 'password'}
+                    entry = {'expires': expires, 'data': data}
+                    index_key = 'admin:{0}:token_keys'.format(admin.uuid)
+                    pipe = redis_client.pipeline()
+                    pipe.set('admin:token:{0}'.format(key), dumps(entry, default=str), ex=ttl)  # 日期时间、UUID转为字符串
+                    pipe.sadd(index_key, key)
+                    pipe.expire(index_key, cache_ttl)  # 不短于索引中任何一个键的有效期
+                    pipe.execute()
+                return admin
+
+    @classmethod
+    def token_cache_stats(cls) -> dict:
+        """身份令牌缓存的命中统计（当前worker）"""
+        return _admin_token_cache.stats()
+
+    def save(self, lock_ut: bool=False, **kwargs) -> int:
+        ret = super().save(lock_ut, **kwargs)
+        self.invalidate_token_cache()
+        return ret
+
+    def delete_instance(self, *args, **kwargs) -> int:
+        ret = super().delete_instance(*args, **kwargs)
+        self.invalidate_token_cache()
+        return ret
+
+    def invalidate_token_cache(self) -> None:
+        """使该管理员的身份令牌缓存失效（Redis和所有worker的进程内缓存）
+
+        save和delete_instance时自动调用；通过Admin.update()、Admin.delete()批量修改时需要手动调用。
+        """
+        index_key = 'admin:{0}:token_keys'.format(self.uuid)
+        keys = ['admin:token:{0}'.format(to_str(k)) for k in redis_client.smembers(index_key)]
+        redis_client.delete(index_key, *keys)
+        if keys:
+            _admin_token_cache.invalidate(*keys)
 
     def gen_token(self) -> str:
         """生成身份令牌"""
@@ -241,12 +359,17 @@ class Admin(_BaseModel, _UUIDMixin, _LoginMixin):
         return aes_crypto.encrypt(text)
 
     def check_password(self, password: str) -> bool:
-        """核对密码"""
-        return check_password_hash(self.password, password)
+        """核对密码，通过后若哈希方式与当前配置（PASSWORD_HASH_METHOD）不一致则重新哈希"""
+        if not verify_password(self.password, password):
+            return False
+        if password_needs_rehash(self.password):
+            self.password = hash_password(password)
+            self.save()
+        return True
 
     def set_password(self, password: str) -> int:
         """设置密码"""
-        self.password = generate_password_hash(password)
+        self.password = hash_password(password)
         return self.save()
 
 
@@ -336,51 +459,94 @@ class Authorizer(_BaseModel):
             self.authorized = False
             return self.save_ut()
 
-    def get_access_token(self) -> str:
-        """获取接口调用凭据"""
-        key = 'authorizer:{0}:access_token'.format(self.appid)
-        value = redis_client.get(key)
-        if value:
-            return to_str(value)
-        access_token, expires_in = component.get_authorizer_access_token(self.appid, self.refresh_token)
-        redis_client.set(key, access_token, ex=int(expires_in) - 300)  # 提前5分钟更新access_token
-        return access_token
-
-    def get_jsapi_ticket(self) -> str:
-        """获取jsapi_ticket"""
-        key = 'authorizer:{0}:jsapi_ticket'.format(self.appid)
-        value = redis_client.get(key)
-        if value:
-            return to_str(value)
-        url = 'https://api.weixin.qq.com/cgi-bin/ticket/getticket'
-        params = {
-            'access_token': self.get_access_token(),
-            'type': 'jsapi'
+    def get_access_token(self, force: bool=False) -> str:
+        """获取接口调用凭据（单飞刷新）
+
+        Args:
+            force: 强制刷新
+        """
+        key = self._credential_key('access_token')
+        return get_or_refresh(key, lambda: component.get_authorizer_access_token(self.appid, self.refresh_token),
+                              force=force)  # 提前5分钟更新access_token
+
+    def get_jsapi_ticket(self, force: bool=False) -> str:
+        """获取jsapi_ticket（单飞刷新）
+
+        Args:
+            force: 强制刷新
+        """
+        key = self._credential_key('jsapi_ticket')
+        return get_or_refresh(key, lambda: self._fetch_ticket('jsapi'), force=force)  # 提前5分钟更新ticket
+
+    def get_card_api_ticket(self, force: bool=False) -> str:
+        """获取微信卡券api_ticket（单飞刷新）
+
+        Args:
+            force: 强制刷新
+        """
+        key = self._credential_key('card_api_ticket')
+        return get_or_refresh(key, lambda: self._fetch_ticket('wx_card'), force=force)  # 提前5分钟更新ticket
+
+    CREDENTIAL_NAMES = ['access_token', 'jsapi_ticket', 'card_api_ticket']  # 先刷新access_token，获取ticket时使用新的
+
+    @classmethod
+    def expiring_credentials(cls, authorizers: Iterable[Authorizer],
+                             min_ttl: int) -> List[Tuple[Authorizer, List[str]]]:
+        """在一次往返中读取多个授权方缓存的凭据的剩余有效期
+
+        Returns:
+            [(授权方, 剩余有效期不足min_ttl秒的凭据名)]，不含没有需要刷新的凭据的授权方
+        """
+        authorizers = list(authorizers)
+        pipe = redis_client.pipeline(transaction=False)
+        for authorizer in authorizers:
+            for name in cls.CREDENTIAL_NAMES:
+                pipe.ttl(authorizer._credential_key(name))
+        ttls = pipe.execute()
+        result = []
+        for i, authorizer in enumerate(authorizers):
+            names = [name for name, ttl in zip(cls.CREDENTIAL_NAMES, ttls[i * 3:i * 3 + 3]) if ttl < min_ttl]
+            if names:
+                result.append((authorizer, names))
+        return result
+
+    def refresh_credentials(self, names: List[str]) -> List[str]:
+        """强制刷新缓存的凭据
+
+        Args:
+            names: 凭据名，CREDENTIAL_NAMES中的一个或多个
+
+        Returns:
+            刷新失败的凭据名（失败时记录日志，不影响其他凭据）
+        """
+        getters = {
+            'access_token': self.get_access_token,
+            'jsapi_ticket': self.get_jsapi_ticket,
+            'card_api_ticket': self.get_card_api_ticket
         }
-        ret = requests.get(url, params=params).json()
-        ticket, expires_in = map(ret.get, ['ticket', 'expires_in'])
-        if not (ticket and expires_in):
-            raise RuntimeError(repr(ret))
-        redis_client.set(key, ticket, ex=int(expires_in) - 300)  # 提前5分钟更新ticket
-        return ticket
-
-    def get_card_api_ticket(self) -> str:
-        """获取微信卡券api_ticket"""
-        key = 'authorizer:{0}:card_api_ticket'.format(self.appid)
-        value = redis_client.get(key)
-        if value:
-            return to_str(value)
+        failed = []
+        for name in sorted(names, key=self.CREDENTIAL_NAMES.index):
+            try:
+                getters[name](force=True)
+            except Exception as e:
+                getLogger(__name__).error('Refreshing {0} of {1} failed: {2!r}'.format(name, self.appid, e))
+                failed.append(name)
+        return failed
+
+    def _credential_key(self, name: str) -> str:
+        return 'authorizer:{0}:{1}'.format(self.appid, name)
+
+    def _fetch_ticket(self, ticket_type: str) -> Tuple[str, int]:
         url = 'https://api.weixin.qq.com/cgi-bin/ticket/getticket'
         params = {
             'access_token': self.get_access_token(),
-            'type': 'wx_card'
+            'type': ticket_type
         }
-        ret = requests.get(url, params=params).json()
+        ret = parse_json(http_client.get(url, params=params))
         ticket, expires_in = map(ret.get, ['ticket', 'expires_in'])
         if not (ticket and expires_in):
             raise RuntimeError(repr(ret))
-        redis_client.set(key, ticket, ex=int(expires_in) - 300)  # 提前5分钟更新ticket
-        return ticket
+        return ticket, expires_in
 
     def get_user_openid_with_code(self, code:str) -> str:
         """根据code换取用户的openid，适用于base授权"""
@@ -393,7 +559,7 @@ class Authorizer(_BaseModel):
             'component_appid': component.app_id,
             'component_access_token': component.get_access_token()
         }
-        ret = requests.get(url, params=params).json()
+        ret = parse_json(http_client.get(url, params=params))
         return ret.get('openid')
 
     def get_user_info_with_code(self, code: str) -> dict:
@@ -407,7 +573,7 @@ class Authorizer(_BaseModel):
             'component_appid': component.app_id,
             'component_access_token': component.get_access_token()
         }
-        ret = requests.get(url, params=params).json()
+        ret = parse_json(http_client.get(url, params=params))
         access_token, openid = map(ret.get, ['access_token', 'openid'])
         if not (access_token and openid):
             raise RuntimeError(repr(ret))
@@ -419,9 +585,8 @@ class Authorizer(_BaseModel):
             'openid': openid,
             'lang': 'zh_CN'
         }
-        resp = requests.get(url, params=params)
-        resp.encoding = 'utf-8'
-        ret = resp.json()
+        resp = http_client.get(url, params=params)
+        ret = parse_json(resp)
         if ret.get('errcode'):
             raise RuntimeError(repr(ret))
         return ret
@@ -434,9 +599,8 @@ class Authorizer(_BaseModel):
             'openid': openid,
             'lang': 'zh_CN'
         }
-        resp = requests.get(url, params=params)
-        resp.encoding = 'utf-8'
-        ret = resp.json()
+        resp = http_client.get(url, params=params)
+        ret = parse_json(resp)
         if ret.get('errcode'):
             raise RuntimeError(repr(ret))
         return ret
@@ -452,7 +616,8 @@ class Authorizer(_BaseModel):
             'msgtype': msg_type,
             msg_type: msg_data
         }
-        ret = requests.post(url, data=json.dumps(body, ensure_ascii=False).encode('utf-8'), params=params).json()
+        resp = http_client.post(url, data=json.dumps(body, ensure_ascii=False).encode('utf-8'), params=params)
+        ret = parse_json(resp)
         if ret.get('errcode'):
             raise RuntimeError(repr(ret))
 
@@ -463,10 +628,10 @@ class Authorizer(_BaseModel):
             'access_token': self.get_access_token(),
             'media_id': media_id
         }
-        resp = requests.get(url, params=params)
+        resp = http_client.get(url, params=params)
         content_type = resp.headers['Content-Type']
         if content_type.startswith('application/json'):
-            raise RuntimeError(repr(resp.json()))
+            raise RuntimeError(repr(parse_json(resp)))
         if not content_type.startswith('image/'):
             raise RuntimeError('Content-Type is {0}'.format(content_type))
         return resp.content
@@ -482,10 +647,9 @@ class Authorizer(_BaseModel):
         params = {
             'access_token': self.get_access_token()
         }
-        resp = requests.get(url, params=params)
+        resp = http_client.get(url, params=params)
         resp.raise_for_status()
-        resp.encoding = 'utf-8'
-        ret = resp.json()
+        ret = parse_json(resp)
         if ret.get('errcode'):
             raise RuntimeError(repr(ret))
         return ret['tags']
@@ -505,9 +669,9 @@ class Authorizer(_BaseModel):
             'tagid': tag_id,
             'next_openid': next_openid
         }
-        resp = requests.post(url, json=body, params=params)
+        resp = http_client.post(url, json=body, params=params)
         resp.raise_for_status()
-        ret = resp.json()
+        ret = parse_json(resp)
         if ret.get('errcode'):
             raise RuntimeError(repr(ret))
         return ret
@@ -539,9 +703,9 @@ class Authorizer(_BaseModel):
             'access_token': self.get_access_token(),
             'next_openid': next_openid
         }
-        resp = requests.get(url, params=params)
+        resp = http_client.get(url, params=params)
         resp.raise_for_status()
-        ret = resp.json()
+        ret = parse_json(resp)
         if ret.get('errcode'):
             raise RuntimeError(repr(ret))
         return ret
@@ -575,10 +739,9 @@ class Authorizer(_BaseModel):
         body = {
             'user_list': [{'openid': openid, 'lang': 'zh_CN'} for openid in openid_list]
         }
-        resp = requests.post(url, json=body, params=params)
+        resp = http_client.post(url, json=body, params=params)
         resp.raise_for_status()
-        resp.encoding = 'utf-8'
-        ret = resp.json()
+        ret = parse_json(resp)
         if ret.get('errcode'):
             raise RuntimeError(repr(ret))
         return ret['user_info_list']
@@ -618,4 +781,27 @@ class UserDemo(_BaseModel):
         table_name = 'demo_user'
 
 
+def serialize_query(query: ModelSelect, *, only: Iterable[str]=None, exclude: Iterable[str]=None,
+                    recurse: bool=False, max_depth: int=None) -> List[dict]:
+    """将查询结果直接转换为dict列表（结果与逐个调用to_dict相同）
+
+    没有额外属性、不递归外键时，只查询需要的列并以tuples()读取，不创建模型对象；
+    否则退回到to_dict_list（批量查询外键关联对象）。
+
+    Args:
+        query: 模型查询
+        only: 仅包含在内的字段名列表
+        exclude: 排除在外的字段名列表
+        recurse: 是否对外键进行递归转换
+        max_depth: 递归深度，默认无限制
+    """
+    model = query.model
+    fields, extras, _ = model._to_dict_plan(only, exclude, recurse, max_depth)
+    if extras or any(recurse_field for _, recurse_field in fields):
+        return model.to_dict_list(query, only=only, exclude=exclude, recurse=recurse, max_depth=max_depth)
+    names = [field_name for field_name, _ in fields]
+    columns = [model._meta.fields[field_name] for field_name in names]
+    return [dict(zip(names, row)) for row in query.select(*columns).tuples()]
+
+
 models = [Admin, Authorizer, UserDemo]
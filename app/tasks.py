@@ -1,7 +1,13 @@
 import email
+from concurrent.futures import ThreadPoolExecutor
+from logging import getLogger
 from os import getenv
+from random import random
+from time import monotonic, sleep
+from typing import List, Optional, Tuple
 
-from huey import RedisHuey
+from huey import RedisHuey, crontab
+from redis.exceptions import LockError
 import smtplib
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
@@ -57,4 +63,57 @@ def send_email(content, name, phone, e_mail):
         except Exception as e:
             print('1020', e, flush=True)
     except Exception as e:
-        print('1022', e, flush=True)
\ No newline at end of file
+        print('1022', e, flush=True)
+
+
+CREDENTIAL_REFRESH_INTERVAL = int(getenv('CREDENTIAL_REFRESH_INTERVAL') or 5)  # 主动刷新凭据的间隔（分钟）
+CREDENTIAL_REFRESH_MIN_TTL = int(getenv('CREDENTIAL_REFRESH_MIN_TTL') or 1200)  # 剩余有效期不足时刷新（秒）
+CREDENTIAL_REFRESH_CONCURRENCY = int(getenv('CREDENTIAL_REFRESH_CONCURRENCY') or 4)  # 同时刷新的公众号数
+CREDENTIAL_REFRESH_JITTER = float(getenv('CREDENTIAL_REFRESH_JITTER') or 30)  # 需要刷新的公众号随机延迟的上限（秒）
+
+
+@huey.periodic_task(crontab(minute='*/{0}'.format(CREDENTIAL_REFRESH_INTERVAL)))
+def refresh_credentials():
+    """主动刷新第三方平台和所有已授权公众号的凭据，使请求中读取凭据时总能命中缓存
+
+    先在一次往返中读取所有凭据的剩余有效期，只刷新不足CREDENTIAL_REFRESH_MIN_TTL秒的（应大于刷新间隔），
+    需要刷新的公众号随机延迟后刷新，分散对微信接口的调用。上一次执行未结束时跳过本次（Redis锁），
+    执行时间超过刷新间隔的80%时不再开始新的刷新，剩下的留给下一次执行。
+    """
+    from utils.redis_util import redis_client
+    from .component import component
+    from .models import Authorizer, db
+
+    logger = getLogger(__name__)
+    period = CREDENTIAL_REFRESH_INTERVAL * 60
+    lock = redis_client.lock('task:refresh_credentials:lock', timeout=period)
+    if not lock.acquire(blocking=False):
+        logger.warning('Skipped refreshing credentials: the previous run is still going')
+        return
+    try:
+        deadline = monotonic() + period * 0.8
+        try:
+            component.refresh_access_token(CREDENTIAL_REFRESH_MIN_TTL)
+        except Exception as e:
+            logger.error('Refreshing component access_token failed: {0!r}'.format(e))
+        with db.connection_context():
+            authorizers = list(Authorizer.select().where(Authorizer.authorized == True))
+        expiring = Authorizer.expiring_credentials(authorizers, CREDENTIAL_REFRESH_MIN_TTL)
+
+        def refresh(item: Tuple[Authorizer, List[str]]) -> Optional[int]:
+            sleep(max(min(random() * CREDENTIAL_REFRESH_JITTER, deadline - monotonic()), 0))
+            if monotonic() >= deadline:
+                return None
+            authorizer, names = item
+            return len(authorizer.refresh_credentials(names))
+
+        with ThreadPoolExecutor(max_workers=CREDENTIAL_REFRESH_CONCURRENCY) as executor:
+            results = list(executor.map(refresh, expiring))
+        failed, skipped = sum(filter(None, results)), results.count(None)
+        logger.info('Refreshed credentials of {0}/{1} authorizers ({2} failures, {3} deferred)'.format(
+            len(expiring) - skipped, len(authorizers), failed, skipped))
+    finally:
+        try:
+            lock.release()
+        except LockError:  # 锁已过期
+            pass
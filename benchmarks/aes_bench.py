@@ -0,0 +1,52 @@
+"""AESCrypto性能对比：python -m benchmarks.aes_bench"""
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from timeit import timeit
+from uuid import uuid4
+
+from Crypto.Cipher import AES
+
+from utils.aes_util import AESCrypto
+from utils.string_util import to_bytes, to_str
+
+
+class LegacyAESCrypto(AESCrypto):
+    """原实现：每次调用都新建CBC对象"""
+
+    def encrypt(self, text):
+        cipher = AES.new(self.key, self.mode, iv=self.iv)
+        text = to_bytes(text)
+        pad_len = self.block_size - len(text) % self.block_size
+        text += bytes([pad_len] * pad_len)
+        cipher_data = cipher.encrypt(text)
+        return to_str(urlsafe_b64encode(cipher_data))
+
+    def decrypt(self, data):
+        cipher = AES.new(self.key, self.mode, iv=self.iv)
+        cipher_data = urlsafe_b64decode(data)
+        text = cipher.decrypt(cipher_data)
+        pad_len = text[-1]
+        return to_str(text[:-pad_len])
+
+
+def main(n: int=5000) -> None:
+    legacy, crypto = LegacyAESCrypto('benchmark'), AESCrypto('benchmark')
+    texts = ['{0}:{1}'.format(uuid4(), 1700000000 + i) for i in range(n)]
+    tokens = [legacy.encrypt(t) for t in texts]
+    assert [crypto.encrypt(t) for t in texts] == tokens == crypto.encrypt_many(texts)
+    assert [crypto.decrypt(t) for t in tokens] == texts == crypto.decrypt_many(tokens)
+
+    cases = [
+        ('encrypt (legacy)', lambda: [legacy.encrypt(t) for t in texts]),
+        ('encrypt', lambda: [crypto.encrypt(t) for t in texts]),
+        ('encrypt_many', lambda: crypto.encrypt_many(texts)),
+        ('decrypt (legacy)', lambda: [legacy.decrypt(t) for t in tokens]),
+        ('decrypt', lambda: [crypto.decrypt(t) for t in tokens]),
+        ('decrypt_many', lambda: crypto.decrypt_many(tokens))
+    ]
+    for name, func in cases:
+        seconds = timeit(func, number=10) / 10
+        print('{0:<18} {1:>10.0f} tokens/s'.format(name, n / seconds))
+
+
+if __name__ == '__main__':
+    main()
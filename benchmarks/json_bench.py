@@ -0,0 +1,84 @@
+"""JSON编码性能对比：python -m benchmarks.json_bench"""
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from json import dumps
+from timeit import timeit
+from uuid import uuid4
+
+from flask import Flask
+from flask.json import JSONEncoder
+
+from app.misc import CustomJSONEncoder, JSONBackend, orjson
+
+
+class LegacyJSONEncoder(JSONEncoder):
+    """原实现：isinstance链 + iter()试探"""
+
+    def default(self, o):
+        if isinstance(o, date):
+            return o.isoformat()
+        if isinstance(o, Decimal):
+            f = float(o)
+            return int(f) if f.is_integer() else f
+        try:
+            iterator = iter(o)
+        except TypeError:
+            pass
+        else:
+            return list(iterator)
+        return super().default(o)
+
+
+def _payloads(n: int) -> dict:
+    now = datetime(2020, 1, 1, 8, 30)
+    admins = [{
+        'id': i,
+        'uuid': uuid4(),
+        'username': 'admin{0}'.format(i),
+        'name': '管理员{0}'.format(i),
+        'mobile': '1380000{0:04d}'.format(i),
+        'active': True,
+        'last_login_time': now + timedelta(minutes=i),
+        'create_time': now,
+        'update_time': now + timedelta(days=1)
+    } for i in range(n)]
+    users = [{
+        'id': i,
+        'uuid': uuid4(),
+        'name': '用户{0}'.format(i),
+        'birthday': date(1990, 1, 1) + timedelta(days=i),
+        'balance': Decimal('{0}.{1:02d}'.format(i, i % 100)),
+        'points': Decimal(i),
+        'tags': {'vip', 'new'} if i % 2 else set(),
+        'create_time': now,
+        'update_time': now
+    } for i in range(n)]
+    return {
+        'admins': {'code': 0, 'message': 'Success', 'data': {'admins': admins}},
+        'users': {'code': 0, 'message': 'Success', 'data': {'users': users}}
+    }
+
+
+def main(n: int=500) -> None:
+    app = Flask(__name__)
+    backends = [('json', JSONBackend('json'))]
+    if orjson is not None:
+        backends.append(('orjson', JSONBackend('orjson')))
+
+    with app.app_context():
+        for payload_name, payload in _payloads(n).items():
+            legacy = dumps(payload, cls=LegacyJSONEncoder, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+            cases = [
+                ('encoder (legacy)', lambda: dumps(payload, cls=LegacyJSONEncoder, sort_keys=True)),
+                ('encoder', lambda: dumps(payload, cls=CustomJSONEncoder, sort_keys=True))
+            ]
+            for name, backend in backends:
+                assert backend.dumps(payload).decode('utf-8') == legacy
+                cases.append(('backend ' + name, lambda backend=backend: backend.dumps(payload)))
+            for name, func in cases:
+                seconds = timeit(func, number=10) / 10
+                print('{0:<8} {1:<18} {2:>10.0f} rows/s'.format(payload_name, name, n / seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+"""请求数据校验性能对比：python -m benchmarks.schema_bench"""
+from timeit import timeit
+
+from app.api_utils import APIError, claim_args, claim_args_int, claim_args_str, claim_args_true, compile_schema
+
+
+def _claim_args_validate(data: dict, str_fields: list, int_fields: list) -> None:
+    """原写法：逐个claim_args_*调用"""
+    str_values = list(map(data.get, str_fields))
+    int_values = list(map(data.get, int_fields))
+    claim_args(1203, *str_values, *int_values)
+    claim_args_str(1204, *str_values)
+    claim_args_int(1204, *int_values)
+    for value in str_values:
+        claim_args_true(1205, len(value) <= 64)
+    for value in int_values:
+        claim_args_true(1205, 0 <= value <= 10000)
+
+
+def main(width: int=50, n: int=10000) -> None:
+    str_fields = ['s{0}'.format(i) for i in range(width // 2)]
+    int_fields = ['i{0}'.format(i) for i in range(width - width // 2)]
+    data = dict({f: 'value-' + f for f in str_fields}, **{f: i for i, f in enumerate(int_fields)})
+    schema = dict({f: {'type': str, 'max_len': 64} for f in str_fields},
+                  **{f: {'type': int, 'min': 0, 'max': 10000} for f in int_fields})
+    validate = compile_schema(schema)
+
+    for bad, code in [(dict(data, s0=''), 1203), (dict(data, i0='1'), 1204), (dict(data, i0=10001), 1205)]:
+        for func in [lambda d: _claim_args_validate(d, str_fields, int_fields), validate]:
+            try:
+                func(bad)
+            except APIError as e:
+                assert e.code == code
+            else:
+                raise AssertionError(code)
+
+    cases = [
+        ('claim_args_*', lambda: _claim_args_validate(data, str_fields, int_fields)),
+        ('compile_schema', lambda: validate(data))
+    ]
+    for name, func in cases:
+        seconds = timeit(func, number=n)
+        print('{0:<16} {1} fields {2:>10.0f} payloads/s'.format(name, width, n / seconds))
+
+
+if __name__ == '__main__':
+    main()
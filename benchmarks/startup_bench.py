@@ -0,0 +1,44 @@
+"""启动耗时（-X importtime汇总）：python -m benchmarks.startup_bench [模块名，默认run]"""
+import sys
+from statistics import median
+from subprocess import run
+from typing import Dict, List, Tuple
+
+
+def import_times(module: str) -> List[Tuple[str, int, int, int]]:
+    """在新的解释器中导入模块，返回[(模块名, 层级, 自身耗时us, 累计耗时us)]"""
+    proc = run([sys.executable, '-X', 'importtime', '-c', 'import ' + module], capture_output=True, text=True)
+    if proc.returncode:
+        raise RuntimeError(proc.stderr)
+    result = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        result.append((name.strip(), depth, int(self_us), int(cumulative_us)))
+    return result
+
+
+def main(module: str='run', n: int=5, top: int=15) -> None:
+    runs = [import_times(module) for _ in range(n)]
+    totals = [times[-1][3] for times in runs]
+    print('import {0}: median {1:.1f}ms, min {2:.1f}ms ({3} runs)'.format(
+        module, median(totals) / 1000, min(totals) / 1000, n))
+
+    times = min(runs, key=lambda t: t[-1][3])
+    packages: Dict[str, int] = {}
+    for name, _, self_us, _ in times:
+        package = name.split('.')[0]
+        packages[package] = packages.get(package, 0) + self_us
+    print('\ntop packages by self time:')
+    for package, us in sorted(packages.items(), key=lambda item: -item[1])[:top]:
+        print('  {0:<32} {1:>8.1f}ms'.format(package, us / 1000))
+    print('\ntop project modules by cumulative time:')
+    project = [t for t in times if t[0].split('.')[0] in ['app', 'utils', 'run']]
+    for name, _, _, cumulative_us in sorted(project, key=lambda t: -t[3])[:top]:
+        print('  {0:<32} {1:>8.1f}ms'.format(name, cumulative_us / 1000))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:2])
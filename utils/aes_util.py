@@ -1,15 +1,23 @@
 from base64 import urlsafe_b64decode, urlsafe_b64encode
 from hashlib import md5
 from os import getenv
-from typing import Union
+from typing import Iterable, List, Union
 
 from Crypto.Cipher import AES
 
+from .lazy_util import LazyProxy
 from .string_util import to_bytes, to_str
 
 
 class AESCrypto:
-    """AES加解密"""
+    """AES加解密（CBC模式，固定IV）
+
+    密钥扩展只在初始化时做一次：用同一个ECB对象处理所有分组，CBC的链接（异或）在Python中完成。
+    - 解密：CBC解密的各分组互相独立，整段密文一次ECB解密后与（IV + 前序密文）整体异或即可
+    - 加密：短文本（身份令牌等）逐分组链接；长文本仍使用AES.new的CBC对象，避免Python循环
+    """
+
+    _SHORT_TEXT_LEN = 64  # 逐分组加密的最大长度（填充后）
 
     def __init__(self, key_seed: Union[bytes, str]):
         """Initializer
@@ -21,23 +29,85 @@ class AESCrypto:
         self.mode = AES.MODE_CBC
         self.iv = self.key[:16]
         self.block_size = AES.block_size
+        self._ecb = AES.new(self.key, AES.MODE_ECB)
+        self._iv_int = int.from_bytes(self.iv, 'big')
+
+    def _pad(self, text: bytes) -> bytes:
+        """PKCS#7填充"""
+        pad_len = self.block_size - len(text) % self.block_size
+        return text + bytes((pad_len,)) * pad_len
+
+    def _encrypt(self, text: bytes) -> Union[bytes, bytearray]:
+        """填充 & CBC加密"""
+        text_len = len(text)
+        pad_len = self.block_size - text_len % self.block_size
+        if text_len + pad_len > self._SHORT_TEXT_LEN:
+            buf = bytearray(text_len + pad_len)  # 一次分配，原地加密
+            buf[:text_len] = text
+            buf[text_len:] = bytes((pad_len,)) * pad_len
+            AES.new(self.key, self.mode, iv=self.iv).encrypt(buf, output=buf)
+            return buf
+        text += bytes((pad_len,)) * pad_len
+        from_bytes, ecb_encrypt = int.from_bytes, self._ecb.encrypt
+        prev, blocks = self._iv_int, []
+        for i in range(0, len(text), 16):
+            block = ecb_encrypt((from_bytes(text[i:i + 16], 'big') ^ prev).to_bytes(16, 'big'))
+            blocks.append(block)
+            prev = from_bytes(block, 'big')
+        return b''.join(blocks)
+
+    def _decrypt(self, cipher_data: bytes, text: bytes) -> str:
+        """CBC解密 & 去除填充：text为cipher_data经ECB解密的结果，去除填充时不复制"""
+        data_len = len(cipher_data)
+        prev = int.from_bytes(self.iv + cipher_data[:-16], 'big')
+        plain = (int.from_bytes(text, 'big') ^ prev).to_bytes(data_len, 'big')
+        return str(memoryview(plain)[:-plain[-1]], 'utf-8')
 
     def encrypt(self, text: Union[bytes, str]) -> str:
         """AES加密 & BASE64编码"""
-        cipher = AES.new(self.key, self.mode, iv=self.iv)
-        text = to_bytes(text)
-        pad_len = self.block_size - len(text) % self.block_size
-        text += bytes([pad_len] * pad_len)
-        cipher_data = cipher.encrypt(text)
+        cipher_data = self._encrypt(to_bytes(text))
         return to_str(urlsafe_b64encode(cipher_data))
 
     def decrypt(self, data: Union[bytes, str]) -> str:
         """BASE64解码 & AES解密"""
-        cipher = AES.new(self.key, self.mode, iv=self.iv)
         cipher_data = urlsafe_b64decode(data)
-        text = cipher.decrypt(cipher_data)
-        pad_len = text[-1]
-        return to_str(text[:-pad_len])
+        return self._decrypt(cipher_data, self._ecb.decrypt(cipher_data))
+
+    def encrypt_many(self, texts: Iterable[Union[bytes, str]]) -> List[str]:
+        """批量AES加密 & BASE64编码
+
+        所有文本按分组位置同步推进，每一轮只调用一次ECB加密。
+        """
+        texts = [self._pad(to_bytes(text)) for text in texts]
+        prevs = [self._iv_int] * len(texts)
+        results = [[] for _ in texts]
+        from_bytes, ecb_encrypt = int.from_bytes, self._ecb.encrypt
+        max_len = max(map(len, texts), default=0)
+        for offset in range(0, max_len, 16):
+            end = offset + 16
+            indexes = [i for i, text in enumerate(texts) if len(text) > offset]
+            blocks = ecb_encrypt(b''.join(
+                (from_bytes(texts[i][offset:end], 'big') ^ prevs[i]).to_bytes(16, 'big') for i in indexes
+            ))
+            for n, i in enumerate(indexes):
+                block = blocks[n * 16:n * 16 + 16]
+                results[i].append(block)
+                prevs[i] = from_bytes(block, 'big')
+        return [to_str(urlsafe_b64encode(b''.join(blocks))) for blocks in results]
+
+    def decrypt_many(self, data_list: Iterable[Union[bytes, str]]) -> List[str]:
+        """批量BASE64解码 & AES解密
+
+        所有密文拼接后只调用一次ECB解密。
+        """
+        cipher_data_list = [urlsafe_b64decode(data) for data in data_list]
+        texts = memoryview(self._ecb.decrypt(b''.join(cipher_data_list)))
+        result, offset = [], 0
+        for cipher_data in cipher_data_list:
+            end = offset + len(cipher_data)
+            result.append(self._decrypt(cipher_data, texts[offset:end]))
+            offset = end
+        return result
 
 
-aes_crypto = AESCrypto(getenv('AES_KEY_SEED'))
+aes_crypto = LazyProxy(lambda: AESCrypto(getenv('AES_KEY_SEED')))
@@ -0,0 +1,84 @@
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+from typing import Any, Callable, Hashable
+
+
+class TTLCache:
+    """进程内LRU缓存（带过期时间）"""
+
+    def __init__(self, maxsize: int=1024, ttl: float=60):
+        """Initializer
+
+        Args:
+            maxsize: 最大条目数，超出时淘汰最久未使用的条目
+            ttl: 默认过期时间（秒）
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: Hashable, default: Any=None) -> Any:
+        """获取，不存在或已过期则返回default"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                value, expires = item
+                if expires > monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any, ttl: float=None) -> None:
+        """设置
+
+        Args:
+            key: 键
+            value: 值
+            ttl: 过期时间（秒），默认使用self.ttl
+        """
+        if ttl is None:
+            ttl = self.ttl
+        with self._lock:
+            self._data[key] = (value, monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any=None) -> Any:
+        """删除并返回"""
+        with self._lock:
+            item = self._data.pop(key, None)
+        return default if item is None else item[0]
+
+    def pop_where(self, predicate: Callable[[Any], bool]) -> int:
+        """删除所有值满足predicate的条目，返回删除的条目数"""
+        with self._lock:
+            keys = [k for k, (v, _) in self._data.items() if predicate(v)]
+            for k in keys:
+                del self._data[k]
+        return len(keys)
+
+    def clear(self) -> None:
+        """清空"""
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        """命中统计"""
+        total = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / total, 4) if total else None
+        }
+
+    def __len__(self) -> int:
+        return len(self._data)
@@ -0,0 +1,70 @@
+from http.cookiejar import DefaultCookiePolicy
+from json import loads
+from os import getenv
+from time import perf_counter
+from typing import Any, Tuple
+
+from requests import PreparedRequest, Response, Session
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    _RETRY_METHODS = {'allowed_methods': Retry.DEFAULT_ALLOWED_METHODS}  # urllib3>=1.26
+except AttributeError:
+    _RETRY_METHODS = {'method_whitelist': Retry.DEFAULT_METHOD_WHITELIST}
+
+
+class HTTPClient(Session):
+    """共享的HTTP客户端：按host复用keep-alive连接，默认超时，幂等请求失败时退避重试
+
+    所有调用方共用，不保存Cookie（避免一个host设置的Cookie被发送给之后的请求）。
+    """
+
+    def __init__(self, timeout: Tuple[float, float]=(3.05, 10), pool_maxsize: int=20, max_retries: int=2,
+                 backoff_factor: float=0.2):
+        """Initializer
+
+        Args:
+            timeout: 默认超时（连接超时秒数, 读取超时秒数），调用时可通过timeout参数覆盖
+            pool_maxsize: 每个host保持的最大连接数
+            max_retries: 最大重试次数（连接失败时所有请求都重试，读取失败和5xx只重试GET等幂等请求）
+            backoff_factor: 重试的退避系数，第n次重试前等待backoff_factor * 2^(n-1)秒
+        """
+        super().__init__()
+        self.timeout = timeout
+        self.send_hooks = []  # 每次请求完成后调用：hook(request, elapsed)
+        self.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        retry = Retry(total=max_retries, backoff_factor=backoff_factor, status_forcelist=[500, 502, 503, 504],
+                      raise_on_status=False, **_RETRY_METHODS)
+        adapter = HTTPAdapter(pool_maxsize=pool_maxsize, max_retries=retry)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+
+    def request(self, method: str, url: str, **kwargs) -> Response:
+        kwargs.setdefault('timeout', self.timeout)
+        return super().request(method, url, **kwargs)
+
+    def send(self, request: PreparedRequest, **kwargs) -> Response:
+        start = perf_counter()
+        try:
+            return super().send(request, **kwargs)
+        finally:
+            elapsed = perf_counter() - start
+            for hook in self.send_hooks:
+                hook(request, elapsed)
+
+
+http_client = HTTPClient(
+    timeout=(float(getenv('HTTP_CONNECT_TIMEOUT') or 3.05), float(getenv('HTTP_READ_TIMEOUT') or 10)),
+    pool_maxsize=int(getenv('HTTP_POOL_MAXSIZE') or 20),
+    max_retries=int(getenv('HTTP_MAX_RETRIES') or 2)
+)
+
+
+def parse_json(resp: Response) -> Any:
+    """解析JSON响应
+
+    微信接口返回的Content-Type（如text/plain）没有声明charset时，requests按ISO-8859-1解码resp.text导致中文乱码，
+    这里直接解析resp.content（按utf-8解码）。
+    """
+    return loads(resp.content)
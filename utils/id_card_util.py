@@ -11,9 +11,6 @@ def dateRange(year):
     return [i.replace('-', '') for i in list_date]
 
 
-data_time = dateRange('1995')
-
-
 # 遍历所有日期，print通过校验的身份证号码
 
 def vali_dator(id1, id2, id3):
@@ -25,4 +22,5 @@ def vali_dator(id1, id2, id3):
             n += 1
 
 
-vali_dator('410222', '1995', '5533')
+if __name__ == '__main__':
+    vali_dator('410222', '1995', '5533')
@@ -1,24 +1,23 @@
 from io import BytesIO
 
-from PIL import Image, ImageFont, ImageDraw, ImageOps
 import io
 import time
-import qrcode
-import requests
 from flask import json, current_app
 
+from utils.http_util import http_client
 from utils.service_util import qn_service
 from utils.weixin_util import get_access_token
 
 
 def gen_image(head_img: str, back_image: str):
     """图片处理"""
+    from PIL import Image, ImageFont, ImageDraw, ImageOps  # PIL只在使用时导入
     # 获取头像
-    head_res = requests.get(head_img)
+    head_res = http_client.get(head_img)
     head_image = Image.open(BytesIO(head_res.content))
     head_image = head_image.resize((120, 120))
     # 获取背景图
-    back_res = requests.get(back_image)
+    back_res = http_client.get(back_image)
     back_image = Image.open(BytesIO(back_res.content))
     back_image = back_image.resize((1080, 1920))
 
@@ -55,7 +54,7 @@ def create_code(page, scene):
         }
         url = 'https://api.weixin.qq.com/wxa/getwxacodeunlimit?access_token={0}'.format(access_token)
         data = json.dumps(data).encode(encoding='utf-8')
-        code_json = requests.post(url, data=data)
+        code_json = http_client.post(url, data=data)
         time_now = int(time.time())
         key = "qiulin/wxcode/{0}.jpg".format(time_now)
         wxcode_url = qn_service.upload_data(key, code_json.content)
@@ -66,6 +65,7 @@ def create_code(page, scene):
 
 def make_code(data):
     """生成二维码"""
+    import qrcode
     # version是二维码的尺寸，数字大小决定二维码的密度
     # error_correction：是指误差
     # box_size:参数用来控制二维码的每个单元(box)格有多少像素点
@@ -92,6 +92,7 @@ def make_code(data):
 
 # 先将 input image 填充为正方形
 def fill_image(image):
+    from PIL import Image
     width, height = image.size
     # 选取长和宽中较大值作为新图片的
     new_image_length = width if width > height else height
@@ -131,6 +132,7 @@ def save_images(image_list):
 
 
 if __name__ == '__main__':
+    from PIL import Image
     file_path = "风景.jpg"
     image = Image.open(file_path)
     image = fill_image(image)
@@ -0,0 +1,46 @@
+from threading import Lock
+from typing import Any, Callable
+
+
+_MISSING = object()
+
+
+class LazyProxy:
+    """延迟构造的对象代理
+
+    第一次访问属性时才调用factory构造对象（只构造一次），之后的属性读写都转发给该对象。
+    用于模块级的服务单例：导入模块时不读取配置、不建立客户端，缺少配置也只在使用时报错。
+    """
+
+    __slots__ = ('_factory', '_obj', '_lock')
+
+    def __init__(self, factory: Callable[[], Any]):
+        """Initializer
+
+        Args:
+            factory: 构造对象的函数
+        """
+        object.__setattr__(self, '_factory', factory)
+        object.__setattr__(self, '_obj', _MISSING)
+        object.__setattr__(self, '_lock', Lock())
+
+    def _get_object(self) -> Any:
+        obj = self._obj
+        if obj is _MISSING:
+            with self._lock:
+                obj = self._obj
+                if obj is _MISSING:
+                    obj = self._factory()
+                    object.__setattr__(self, '_obj', obj)
+        return obj
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._get_object(), name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        setattr(self._get_object(), name, value)
+
+    def __repr__(self) -> str:
+        if self._obj is _MISSING:
+            return '<LazyProxy (not constructed) {0!r}>'.format(self._factory)
+        return '<LazyProxy {0!r}>'.format(self._obj)
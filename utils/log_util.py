@@ -0,0 +1,154 @@
+import atexit
+import sys
+from copy import copy
+from json import dumps
+from logging import Filter, Formatter, Handler, LogRecord, StreamHandler
+from logging.handlers import QueueHandler, QueueListener
+from os import getenv
+from random import random
+from time import perf_counter
+from typing import Any
+
+from flask import g, has_request_context, request
+
+
+LOG_BODY_SAMPLE_RATE = float(getenv('LOG_BODY_SAMPLE_RATE') or 1)  # 记录请求数据的比例
+LOG_BODY_MAX_LEN = int(getenv('LOG_BODY_MAX_LEN') or 2048)  # 请求数据的最大记录长度
+LOG_REDACT_FIELDS = frozenset(
+    f.strip().lower() for f in (getenv('LOG_REDACT_FIELDS') or 'password,token,secret,authorization,cookie').split(',')
+)  # 需要隐去的字段（不区分大小写），包括请求头
+REDACTED = '******'
+
+
+def _original(name: str):
+    """未被eventlet monkey patch的标准库模块"""
+    if 'eventlet' in sys.modules:
+        from eventlet.patcher import original
+        return original(name)
+    return __import__(name)
+
+
+class JSONFormatter(Formatter):
+    """JSON格式（每条日志一行）"""
+
+    FIELDS = ['request_id', 'method', 'path', 'endpoint', 'latency_ms']
+
+    def format(self, record: LogRecord) -> str:
+        data = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'location': '{0.pathname}:{0.lineno}'.format(record),
+            'message': record.getMessage()
+        }
+        for key in self.FIELDS:
+            value = getattr(record, key, None)
+            if value is not None:
+                data[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data['exc_info'] = record.exc_text
+        return dumps(data, ensure_ascii=False, default=str)
+
+
+class RequestContextFilter(Filter):
+    """为日志记录添加请求上下文：request_id、method、path、endpoint、latency_ms（自请求开始）"""
+
+    def filter(self, record: LogRecord) -> bool:
+        if has_request_context():
+            record.request_id = g.get('request_id')
+            record.method = request.method
+            record.path = request.path
+            record.endpoint = request.endpoint
+            start = g.get('request_start')
+            if start is not None:
+                record.latency_ms = round((perf_counter() - start) * 1000, 1)
+        return True
+
+
+class _QueueHandler(QueueHandler):
+    """队列满时丢弃日志，不阻塞请求"""
+
+    def __init__(self, queue):
+        super().__init__(queue)
+        self.dropped = 0
+        self._exc_formatter = Formatter()
+
+    def prepare(self, record: LogRecord) -> LogRecord:
+        """复制日志记录，只把异常渲染为exc_text（不持有traceback和栈帧），消息的格式化留给后台线程中的handler"""
+        record = copy(record)
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = self._exc_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except Exception:
+            self.dropped += 1
+
+
+class _QueueListener(QueueListener):
+    """在原生线程中写日志（eventlet下不占用hub）"""
+
+    def start(self) -> None:
+        self._thread = thread = _original('threading').Thread(target=self._monitor, name='log-listener')
+        thread.daemon = True
+        thread.start()
+
+
+def create_queue_handler(handler: Handler, maxsize: int=10000) -> QueueHandler:
+    """创建队列日志处理器
+
+    请求greenlet中只复制日志记录（异常渲染为文本）并放入队列，消息的格式化和写出由后台原生线程中的handler完成。
+
+    Args:
+        handler: 实际写出日志的handler
+        maxsize: 队列长度，队列满时丢弃新的日志
+    """
+    handler.lock = _original('threading').RLock()  # 只在后台线程中使用
+    queue_handler = _QueueHandler(_original('queue').Queue(maxsize))
+    queue_handler.listener = _QueueListener(queue_handler.queue, handler, respect_handler_level=True)
+    queue_handler.listener.start()
+    atexit.register(queue_handler.listener.stop)  # 退出前写完队列中的日志
+    return queue_handler
+
+
+def create_stream_handler(json_format: bool=True) -> StreamHandler:
+    """创建输出到stderr的handler"""
+    handler = StreamHandler()
+    if json_format:
+        handler.setFormatter(JSONFormatter())
+    else:
+        handler.setFormatter(Formatter('[%(asctime)s] %(pathname)s:%(lineno)d [%(levelname)s] %(message)s'))
+    return handler
+
+
+def redact(data: Any) -> Any:
+    """隐去dict（包括嵌套的dict、list）中的敏感字段"""
+    if isinstance(data, dict):
+        return {k: REDACTED if str(k).lower() in LOG_REDACT_FIELDS else redact(v) for k, v in data.items()}
+    if isinstance(data, list):
+        return [redact(v) for v in data]
+    return data
+
+
+def sample_body() -> bool:
+    """本次请求是否记录请求数据（按LOG_BODY_SAMPLE_RATE抽样）"""
+    return LOG_BODY_SAMPLE_RATE >= 1 or random() < LOG_BODY_SAMPLE_RATE
+
+
+def format_body(data: Any) -> str:
+    """请求数据的日志文本：隐去敏感字段，超过LOG_BODY_MAX_LEN时截断"""
+    if isinstance(data, (bytes, bytearray)):
+        text = data[:LOG_BODY_MAX_LEN].decode('utf-8', 'replace')
+        size = len(data)
+    else:
+        text = dumps(redact(data), ensure_ascii=False, default=str)
+        size = len(text)
+    if size > LOG_BODY_MAX_LEN:
+        return '{0}...({1} bytes)'.format(text[:LOG_BODY_MAX_LEN], size)
+    return text
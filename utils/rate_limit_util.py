@@ -0,0 +1,79 @@
+from os import getenv
+from time import time
+from typing import Dict, Optional, Tuple
+from uuid import uuid4
+
+from flask import current_app
+
+from .redis_util import redis_client
+
+
+# KEYS: 各维度的键；ARGV: 当前时间（毫秒）、窗口（毫秒）、本次记录的member、各维度的上限
+# 任一维度超限时不记录本次请求，返回{超限维度的序号, 距最早一次请求移出窗口的毫秒数}；否则记录并返回{0, 0}
+_SLIDING_WINDOW_SCRIPT = """
+local now = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+for i, key in ipairs(KEYS) do
+    redis.call('ZREMRANGEBYSCORE', key, '-inf', now - window)
+    if redis.call('ZCARD', key) >= tonumber(ARGV[3 + i]) then
+        local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+        return {i, tonumber(oldest[2]) + window - now}
+    end
+end
+for _, key in ipairs(KEYS) do
+    redis.call('ZADD', key, now, ARGV[3])
+    redis.call('PEXPIRE', key, window)
+end
+return {0, 0}
+"""
+
+
+class SlidingWindowLimiter:
+    """滑动窗口限流（Redis ZSET，所有维度在一次EVALSHA中原子地检查和记录）"""
+
+    def __init__(self, name: str, window: float, limits: Dict[str, int]):
+        """Initializer
+
+        Args:
+            name: 限流器名称，用于Redis键
+            window: 窗口长度（秒）
+            limits: 维度 -> 窗口内允许的最大次数，如：{'ip': 20, 'username': 10}
+        """
+        self.name = name
+        self.window_ms = int(window * 1000)
+        self.limits = limits
+        self._script = redis_client.register_script(_SLIDING_WINDOW_SCRIPT)
+
+    def hit(self, **values) -> Optional[Tuple[str, float]]:
+        """记录一次请求
+
+        Args:
+            values: 维度 -> 值（为空的维度不限流），如：ip='1.2.3.4', username='admin'
+
+        Returns:
+            未超限时返回None，否则返回(超限的维度, 需要等待的秒数)；Redis不可用时不限流
+        """
+        dims = [dim for dim in self.limits if values.get(dim)]
+        if not dims:
+            return None
+        keys = ['rate_limit:{0}:{1}:{2}'.format(self.name, dim, values[dim]) for dim in dims]
+        now = int(time() * 1000)
+        args = [now, self.window_ms, '{0}:{1}'.format(now, uuid4().hex[:8])] + [self.limits[dim] for dim in dims]
+        try:
+            index, retry_ms = self._script(keys=keys, args=args)
+        except Exception as e:
+            current_app.logger.error(e)
+            return None
+        if index == 0:
+            return None
+        return dims[index - 1], max(int(retry_ms), 0) / 1000
+
+
+login_limiter = SlidingWindowLimiter(
+    'login',
+    window=int(getenv('LOGIN_RATE_LIMIT_WINDOW') or 60),
+    limits={
+        'ip': int(getenv('LOGIN_RATE_LIMIT_IP') or 20),
+        'username': int(getenv('LOGIN_RATE_LIMIT_USERNAME') or 10)
+    }
+)
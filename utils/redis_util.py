@@ -1,10 +1,219 @@
-from os import getenv
+from logging import Logger, getLogger
+from os import getenv, getpid
+from threading import Lock, Thread
+from time import monotonic, sleep
+from typing import Any, Callable, Tuple
+from uuid import uuid4
 
+from flask import current_app, has_app_context
 from redis import Redis
+from redis.client import Pipeline
+from redis.exceptions import LockError
 
+from .cache_util import TTLCache
+from .string_util import to_str
 
-redis_client = Redis(
+
+class _Redis(Redis):
+    """支持命令钩子的Redis客户端"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.command_hooks = []  # 每条命令执行前调用：hook(command_name)
+
+    def execute_command(self, *args, **options):
+        for hook in self.command_hooks:
+            hook(args[0])
+        return super().execute_command(*args, **options)
+
+    def pipeline(self, transaction: bool=True, shard_hint: str=None) -> '_Pipeline':
+        return _Pipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint, self.command_hooks)
+
+
+class _Pipeline(Pipeline):
+    """支持命令钩子的Pipeline：每条命令入队（或WATCH后立即执行）时调用钩子，即按命令数而不是往返次数计数"""
+
+    def __init__(self, connection_pool, response_callbacks, transaction, shard_hint, command_hooks: list):
+        super().__init__(connection_pool, response_callbacks, transaction, shard_hint)
+        self.command_hooks = command_hooks
+
+    def execute_command(self, *args, **options):
+        for hook in self.command_hooks:
+            hook(args[0])
+        return super().execute_command(*args, **options)
+
+
+redis_client = _Redis(
     host=getenv('REDIS_HOST') or '127.0.0.1',
     port=int(getenv('REDIS_PORT') or 6379),
     db=int(getenv('REDIS_DB') or 0)
 )
+
+
+def _logger() -> Logger:
+    return current_app.logger if has_app_context() else getLogger(__name__)
+
+
+class TwoTierCache:
+    """两级缓存：进程内TTLCache + Redis
+
+    读取时先查进程内缓存，未命中时在一次往返中读取Redis中的值和剩余有效期（PTTL），进程内的有效期不超过Redis中的。
+    通过set/invalidate改写的键会在channel上发布失效通知，各进程的订阅线程（eventlet下为greenlet）收到后删除本地副本；
+    订阅断开期间的通知会丢失，重新订阅时清空本地缓存，本地有效期（local_ttl）是过期数据的最长存活时间。
+    """
+
+    def __init__(self, client: Redis, channel: str, local_ttl: float=60, maxsize: int=1024,
+                 loads: Callable[[bytes], Any]=None):
+        """Initializer
+
+        Args:
+            client: Redis客户端
+            channel: 失效通知的频道
+            local_ttl: 进程内缓存的最长有效期（秒）
+            maxsize: 进程内缓存的最大条目数
+            loads: 从Redis读取的值的解码函数，进程内缓存解码后的值（默认缓存bytes）
+        """
+        self.client = client
+        self.channel = channel
+        self.loads = loads
+        self.redis_hits = 0
+        self.redis_misses = 0
+        self._local = TTLCache(maxsize=maxsize, ttl=local_ttl)
+        self._origin = uuid4().hex  # 忽略本进程发布的通知
+        self._pid = None  # 订阅线程所在的进程（fork后需要重新启动）
+        self._lock = Lock()
+
+    def get(self, key: str) -> Any:
+        """读取，不存在时返回None"""
+        self._ensure_subscriber()
+        value = self._local.get(key)
+        if value is not None:
+            return value
+        pipe = self.client.pipeline(transaction=False)
+        pipe.get(key)
+        pipe.pttl(key)
+        value, pttl = pipe.execute()
+        if value is None:
+            self.redis_misses += 1
+            return None
+        self.redis_hits += 1
+        if self.loads is not None:
+            value = self.loads(value)
+        ttl = self._local.ttl if pttl < 0 else min(self._local.ttl, pttl / 1000)  # pttl为-1时没有过期时间
+        self._local.set(key, value, ttl=ttl)
+        return value
+
+    def set(self, key: str, value: str, ex: int=None) -> None:
+        """写入Redis，并通知其他进程"""
+        self.client.set(key, value, ex=ex)
+        self.invalidate(key)
+
+    def invalidate(self, *keys: str) -> None:
+        """删除本地副本，并通知其他进程（Redis中的值已被改写后调用）"""
+        self._ensure_subscriber()
+        pipe = self.client.pipeline(transaction=False)
+        for key in keys:
+            self._local.pop(key)
+            pipe.publish(self.channel, '{0}:{1}'.format(self._origin, key))
+        pipe.execute()
+
+    def stats(self) -> dict:
+        """命中统计（当前进程）"""
+        return {'local': self._local.stats(), 'redis_hits': self.redis_hits, 'redis_misses': self.redis_misses}
+
+    def _ensure_subscriber(self) -> None:
+        if self._pid == getpid():
+            return
+        with self._lock:
+            if self._pid != getpid():
+                self._local.clear()
+                Thread(target=self._subscribe, name='TwoTierCache-{0}'.format(self.channel), daemon=True).start()
+                self._pid = getpid()
+
+    def _subscribe(self) -> None:
+        """接收失效通知，断开后重新订阅"""
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                self._local.clear()  # 订阅之前的通知可能已丢失
+                for message in pubsub.listen():
+                    origin, _, key = to_str(message['data']).partition(':')
+                    if origin != self._origin:
+                        self._local.pop(key)
+            except Exception as e:
+                getLogger(__name__).error('Subscribing to {0} failed: {1!r}'.format(self.channel, e))
+                sleep(1)
+
+
+credential_cache = TwoTierCache(redis_client, 'cache:invalidate:credentials',
+                                local_ttl=float(getenv('CREDENTIAL_LOCAL_TTL') or 60))
+
+
+def get_or_refresh(key: str, fetch: Callable[[], Tuple[str, int]], *, refresh_ahead: int=300, force: bool=False,
+                   lock_timeout: float=150, wait_timeout: float=5, stale_retry: int=30) -> str:
+    """读取缓存在Redis中的凭据（access_token、ticket等），不存在时单飞（single-flight）刷新
+
+    同一时间只有取得Redis锁（{key}:lock）的调用者执行fetch（取得锁后再检查一次缓存，避免重复刷新使刚获取的凭据失效），
+    其他调用者轮询等待新值（最多wait_timeout秒），超时或fetch失败时回退到旧值（{key}:stale，保留到凭据真正过期），
+    都没有时抛出异常。fetch失败时旧值以stale_retry秒的有效期写回key，期间的调用者不再重复请求微信接口。
+
+    Args:
+        key: Redis键（先经过credential_cache读取）
+        fetch: 获取新凭据的函数，返回(凭据, 有效期秒数)
+        refresh_ahead: 提前多少秒视为过期（缓存的有效期 = 凭据有效期 - refresh_ahead）
+        force: 忽略缓存，强制刷新（已有其他调用者在刷新时直接返回当前值）
+        lock_timeout: 锁的过期时间（秒），应大于fetch的最长耗时（ticket -> 授权方access_token -> 第三方平台access_token
+            依次刷新时，每次HTTP请求在超时和重试下最多约40秒）
+        wait_timeout: 等待其他调用者刷新的最长时间（秒）
+        stale_retry: fetch失败后再次尝试刷新的间隔（秒）
+
+    Raises:
+        RuntimeError: 等待超时且没有旧值
+        Exception: fetch抛出的异常（没有旧值时）
+    """
+    if not force:
+        value = credential_cache.get(key)
+        if value:
+            return to_str(value)
+    lock = redis_client.lock(key + ':lock', timeout=lock_timeout)
+    deadline, interval = monotonic() + wait_timeout, 0.02
+    while True:
+        if lock.acquire(blocking=False):
+            try:
+                if not force:
+                    value = redis_client.get(key)  # 其他调用者可能刚刚刷新完并释放了锁
+                    if value:
+                        return to_str(value)
+                value, expires_in = fetch()
+                pipe = redis_client.pipeline()
+                pipe.set(key, value, ex=max(int(expires_in) - refresh_ahead, 1))
+                pipe.set(key + ':stale', value, ex=int(expires_in))
+                pipe.execute()
+                credential_cache.invalidate(key)
+                return value
+            except Exception as e:
+                stale = redis_client.get(key + ':stale')
+                if not stale:
+                    raise
+                _logger().error('Refreshing {0} failed, using the stale value: {1!r}'.format(key, e))
+                ttl = redis_client.ttl(key + ':stale')
+                redis_client.set(key, stale, ex=max(min(stale_retry, ttl), 1))
+                credential_cache.invalidate(key)
+                return to_str(stale)
+            finally:
+                try:
+                    lock.release()
+                except LockError:  # 锁已过期
+                    pass
+        if force or monotonic() >= deadline:
+            break
+        sleep(interval)
+        interval = min(interval * 2, 0.5)
+        value = redis_client.get(key)
+        if value:
+            return to_str(value)
+    value = redis_client.get(key) or redis_client.get(key + ':stale')
+    if value:
+        return to_str(value)
+    raise RuntimeError('Timed out waiting for {0} to be refreshed'.format(key))
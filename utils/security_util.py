@@ -0,0 +1,50 @@
+import sys
+from os import getenv
+from typing import Any, Callable
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+
+def _normalize_method(method: str) -> str:
+    """补全pbkdf2的迭代次数，使其与哈希值中记录的method一致"""
+    if method.startswith('pbkdf2:') and method.count(':') == 1:
+        method = '{0}:{1}'.format(method, DEFAULT_PBKDF2_ITERATIONS)
+    return method
+
+
+PASSWORD_HASH_METHOD = _normalize_method(getenv('PASSWORD_HASH_METHOD') or 'pbkdf2:sha256')
+
+
+def is_green() -> bool:
+    """是否运行在monkey patch后的eventlet中"""
+    if 'eventlet' not in sys.modules:
+        return False
+    from eventlet.patcher import is_monkey_patched
+    return is_monkey_patched('thread')
+
+
+def run_blocking(func: Callable, *args) -> Any:
+    """执行CPU密集的函数
+
+    在eventlet worker中交给原生线程池（eventlet.tpool，大小由EVENTLET_THREADPOOL_SIZE决定）执行，
+    当前greenlet等待结果，hub和其他greenlet不被阻塞；其他环境下直接执行。
+    """
+    if is_green():
+        from eventlet import tpool
+        return tpool.execute(func, *args)
+    return func(*args)
+
+
+def hash_password(password: str) -> str:
+    """生成密码哈希"""
+    return run_blocking(generate_password_hash, password, PASSWORD_HASH_METHOD)
+
+
+def verify_password(pw_hash: str, password: str) -> bool:
+    """核对密码"""
+    return run_blocking(check_password_hash, pw_hash, password)
+
+
+def password_needs_rehash(pw_hash: str) -> bool:
+    """密码哈希的method（算法、迭代次数）是否与当前配置不一致"""
+    return pw_hash.split('$', 1)[0] != PASSWORD_HASH_METHOD
@@ -3,12 +3,8 @@ from json import dumps
 from os import getenv
 from typing import BinaryIO, Iterable, Optional, Union
 
-import requests
-from qiniu import Auth, put_data, put_file
-from aliyunsdkcore.client import AcsClient
-from aliyunsdkcore.profile import region_provider
-from aliyunsdkdysmsapi.request.v20170525 import SendSmsRequest
-
+from .http_util import http_client, parse_json
+from .lazy_util import LazyProxy
 from .string_util import to_bytes
 
 
@@ -16,6 +12,7 @@ class QNService:
     """七牛"""
 
     def __init__(self, access_key: str, secret_key: str, bucket: str, domain: str):
+        from qiniu import Auth  # 七牛SDK只在使用时导入
         self.auth = Auth(access_key, secret_key)
         self.bucket = bucket
         self.domain = domain
@@ -31,6 +28,7 @@ class QNService:
             key: 上传的文件名
             data: 上传的二进制流
         """
+        from qiniu import put_data
         up_token = self.gen_upload_token(key=key)
         ret, _ = put_data(up_token, key, data)
         if ret and ret.get('key') == key:
@@ -44,6 +42,7 @@ class QNService:
             key: 上传的文件名
             file_path: 上传文件的路径
         """
+        from qiniu import put_file
         up_token = self.gen_upload_token(key=key)
         ret, _ = put_file(up_token, key, file_path)
         if ret and ret.get('key') == key:
@@ -72,9 +71,9 @@ class YPService:
             'mobile': mobile,
             'text': text
         }
-        resp = requests.post('https://sms.yunpian.com/v2/sms/single_send.json', data=body)
+        resp = http_client.post('https://sms.yunpian.com/v2/sms/single_send.json', data=body)
         resp.raise_for_status()
-        return resp.json()
+        return parse_json(resp)
 
     def batch_send(self, mobiles: Iterable[str], text: str) -> dict:
         """批量发送，返回云片响应数据
@@ -91,9 +90,9 @@ class YPService:
             'mobile': ','.join(mobiles),
             'text': text
         }
-        resp = requests.post('https://sms.yunpian.com/v2/sms/batch_send.json', data=body)
+        resp = http_client.post('https://sms.yunpian.com/v2/sms/batch_send.json', data=body)
         resp.raise_for_status()
-        return resp.json()
+        return parse_json(resp)
 
 
 class WXMPService:
@@ -116,9 +115,9 @@ class WXMPService:
             'app_id': self.app_id,
             'token': self.console_token
         }
-        resp = requests.get(url, params=params)
+        resp = http_client.get(url, params=params)
         resp.raise_for_status()
-        ret = resp.json()
+        ret = parse_json(resp)
         access_token = ret['data'].get('access_token')
         if not access_token:
             raise RuntimeError(repr(ret))
@@ -136,9 +135,9 @@ class WXMPService:
             'app_id': self.app_id,
             'token': self.console_token
         }
-        resp = requests.get(url, params=params)
+        resp = http_client.get(url, params=params)
         resp.raise_for_status()
-        ret = resp.json()
+        ret = parse_json(resp)
         ticket = ret['data'].get('jsapi_ticket')
         if not ticket:
             raise RuntimeError(repr(ret))
@@ -157,10 +156,9 @@ class WXMPService:
             'openid': openid,
             'lang': 'zh_CN'
         }
-        resp = requests.get(url, params=params)
+        resp = http_client.get(url, params=params)
         resp.raise_for_status()
-        resp.encoding = 'utf-8'
-        ret = resp.json()
+        ret = parse_json(resp)
         if ret.get('errcode'):
             raise RuntimeError(repr(ret))
         return ret
@@ -180,9 +178,9 @@ class WXMPService:
             'code': code,
             'grant_type': 'authorization_code'
         }
-        resp = requests.get(url, params=params)
+        resp = http_client.get(url, params=params)
         resp.raise_for_status()
-        ret = resp.json()
+        ret = parse_json(resp)
         access_token, openid = map(ret.get, ['access_token', 'openid'])
         if not (access_token and openid):
             raise RuntimeError(repr(ret))
@@ -194,10 +192,9 @@ class WXMPService:
             'openid': openid,
             'lang': 'zh_CN'
         }
-        resp = requests.get(url, params=params)
+        resp = http_client.get(url, params=params)
         resp.raise_for_status()
-        resp.encoding = 'utf-8'
-        ret = resp.json()
+        ret = parse_json(resp)
         if ret.get('errcode'):
             raise RuntimeError(repr(ret))
         return ret
@@ -218,9 +215,9 @@ class WXMPService:
             'msgtype': msg_type,
             msg_type: msg_data
         }
-        resp = requests.post(url, data=to_bytes(dumps(body, ensure_ascii=False)), params=params)
+        resp = http_client.post(url, data=to_bytes(dumps(body, ensure_ascii=False)), params=params)
         resp.raise_for_status()
-        ret = resp.json()
+        ret = parse_json(resp)
         if ret.get('errcode'):
             raise RuntimeError(repr(ret))
 
@@ -228,10 +225,13 @@ class WXMPService:
 class AliyunSmsService:
     """阿里云短信平台"""
     def __init__(self, access_key, access_secret):
+        from aliyunsdkcore.client import AcsClient  # 阿里云SDK导入较慢，只在使用时导入
+        from aliyunsdkcore.profile import region_provider
         self.acs_client = AcsClient(access_key, access_secret, 'cn-beijing')
         region_provider.add_endpoint('Dysmsapi', 'cn-beijing', 'dysmsapi.aliyuncs.com')
 
     def send_sms(self, business_id, phone_numbers, sign_name, template_code, template_param=None):
+        from aliyunsdkdysmsapi.request.v20170525 import SendSmsRequest
         sms_request = SendSmsRequest.SendSmsRequest()
         sms_request.set_TemplateCode(template_code)
         if template_param is not None:
@@ -243,8 +243,10 @@ class AliyunSmsService:
         return sms_response
 
 
-qn_service = QNService(getenv('QN_ACCESS_KEY'), getenv('QN_SECRET_KEY'), getenv('QN_BUCKET'), getenv('QN_DOMAIN'))
-yp_service = YPService(getenv('YP_API_KEY'))
-wx_mp_service = WXMPService(getenv('WX_MP_APP_ID'), getenv('WX_MP_APP_SECRET'))
-aliyun_sms_service = AliyunSmsService(getenv('ALI_SMS_KEY'), getenv('ALI_SMS_SECRET'))
+# 服务单例在第一次使用时构造
+qn_service = LazyProxy(lambda: QNService(getenv('QN_ACCESS_KEY'), getenv('QN_SECRET_KEY'), getenv('QN_BUCKET'),
+                                         getenv('QN_DOMAIN')))
+yp_service = LazyProxy(lambda: YPService(getenv('YP_API_KEY')))
+wx_mp_service = LazyProxy(lambda: WXMPService(getenv('WX_MP_APP_ID'), getenv('WX_MP_APP_SECRET')))
+aliyun_sms_service = LazyProxy(lambda: AliyunSmsService(getenv('ALI_SMS_KEY'), getenv('ALI_SMS_SECRET')))
 
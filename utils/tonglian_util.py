@@ -2,13 +2,14 @@ from binascii import b2a_hex
 from os import getenv
 from time import time_ns
 
-import requests
 import xmltodict
 from Crypto.Hash import SHA1
 from Crypto.PublicKey import RSA
 from Crypto.Signature import PKCS1_v1_5
 from flask import url_for
 
+from .http_util import http_client
+
 
 class TLTService:
     """通联通"""
@@ -32,7 +33,7 @@ class TLTService:
                 }
             }
         }
-        resp = requests.post(self.URL, data=self._encrypt(msg), params=self._req_params(req_sn))
+        resp = http_client.post(self.URL, data=self._encrypt(msg), params=self._req_params(req_sn))
         return xmltodict.parse(resp.text)
 
     def three_ver(self, req_sn: str, merchant_id: str, submit_time: str, account_no: str, account_name: str, id_no: str,
@@ -55,7 +56,7 @@ class TLTService:
                 }
             }
         }
-        resp = requests.post(self.URL, data=self._encrypt(msg), params=self._req_params(req_sn))
+        resp = http_client.post(self.URL, data=self._encrypt(msg), params=self._req_params(req_sn))
         return xmltodict.parse(resp.text)
 
     def four_ver(self, req_sn: str, merchant_id: str, submit_time: str, account_no: str, account_name: str, id_no: str,
@@ -80,7 +81,7 @@ class TLTService:
             }
         }
         # print(self._encrypt(msg).decode('GBK'), flush=True)
-        resp = requests.post(self.URL, data=self._encrypt(msg), params=self._req_params(req_sn))
+        resp = http_client.post(self.URL, data=self._encrypt(msg), params=self._req_params(req_sn))
         # print(resp.text, flush=True)
         return xmltodict.parse(resp.text)
 
@@ -95,7 +96,7 @@ class TLTService:
                 }
             }
         }
-        resp = requests.post(self.URL, data=self._encrypt(msg), params=self._req_params(req_sn))
+        resp = http_client.post(self.URL, data=self._encrypt(msg), params=self._req_params(req_sn))
         return xmltodict.parse(resp.text)
 
     def batch_pay(self, req_sn: str, merchant_id: str, submit_time: str, total_item: str, total_sum: str, data: list) -> dict:
@@ -128,7 +129,7 @@ class TLTService:
                 }
             }
         }
-        resp = requests.post(self.URL, data=self._encrypt(msg), params=self._req_params(req_sn))
+        resp = http_client.post(self.URL, data=self._encrypt(msg), params=self._req_params(req_sn))
         return xmltodict.parse(resp.text)
 
     def balance_query(self, req_sn: str, acctno: str):
@@ -141,7 +142,7 @@ class TLTService:
                 }
             }
         }
-        resp = requests.post(self.URL, data=self._encrypt(msg), params=self._req_params(req_sn))
+        resp = http_client.post(self.URL, data=self._encrypt(msg), params=self._req_params(req_sn))
         return xmltodict.parse(resp.text)
 
     def _encrypt(self, msg: dict) -> bytes:
@@ -2,12 +2,12 @@
 import hashlib
 import os
 from hashlib import md5
+from .http_util import http_client, parse_json
 from .string_util import to_bytes, gen_random_str
 
 import time
 
 from flask import current_app, url_for
-import requests
 import xmltodict
 
 WEIXIN = {
@@ -35,7 +35,7 @@ def get_session_key_by_code(code):
         'js_code': code,
         'grant_type': 'authorization_code'
     }
-    resp_json = requests.get(wx_url, params=params, verify=False).json()
+    resp_json = parse_json(http_client.get(wx_url, params=params, verify=False))
     try:
         openid, session_key, unionid = map(resp_json.get, ('openid', 'session_key', 'unionid'))
     except Exception as e:
@@ -52,7 +52,7 @@ def get_access_token() -> str:
         'app_id': WEIXIN['app_id'],
         'token': console_token
     }
-    ret = requests.get(url, params=params).json()
+    ret = parse_json(http_client.get(url, params=params))
     access_token = ret['data'].get('access_token')
     if not access_token:
         raise RuntimeError(repr(ret))
@@ -98,7 +98,7 @@ def place_order(order):
     params['nonce_str'] = gen_random_str(16)
     params['sign'] = generate_pay_sign(params)
     xml = current_app.jinja_env.get_template(template).render(**params)
-    resp = requests.post(wx_url, data=xml.encode('utf-8'), headers=_HEADERS)
+    resp = http_client.post(wx_url, data=xml.encode('utf-8'), headers=_HEADERS)
     resp.encoding = 'utf-8'
     try:
         result = xmltodict.parse(resp.text)['xml']
@@ -159,7 +159,7 @@ def apply_for_refund(refund):
     data['xml']['sign'] = sign
     xml = xmltodict.unparse(data, full_document=False)
     cert = (WEIXIN['cert_path'], WEIXIN['key_path'])
-    resp = requests.post(wx_url, data=xml, headers=_HEADERS, cert=cert)
+    resp = http_client.post(wx_url, data=xml, headers=_HEADERS, cert=cert)
     resp.encoding = 'utf-8'
     try:
         result = xmltodict.parse(resp.text)['xml']
@@ -187,7 +187,7 @@ def query_order(order):
     }
     params['sign'] = generate_pay_sign(params)
     xml = current_app.jinja_env.get_template(template).render(**params)
-    resp = requests.post(wx_url, data=xml.encode('utf-8'), headers=_HEADERS)
+    resp = http_client.post(wx_url, data=xml.encode('utf-8'), headers=_HEADERS)
     resp.encoding = 'utf-8'
     try:
         result = xmltodict.parse(resp.text)['xml']
@@ -32,4 +32,6 @@ def bruteForce(zip_file):
                 i += 1
         length += 1
 
-bruteForce(file_name)
\ No newline at end of file
+
+if __name__ == '__main__':
+    bruteForce(file_name)